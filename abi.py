@@ -0,0 +1,160 @@
+import sys , struct , hashlib , subprocess
+import noob.filetools
+
+
+# Fingerprint of the interface of a shared library : its exported dynamic
+# symbols ( name , version , type , binding and size of the data ) and its
+# soname. Two builds of a library with the same fingerprint can be swapped
+# without relinking the executables and libraries linked against it : only
+# the body of its functions has changed.
+#
+# The symbols are read from the ELF dynamic symbol table, or listed with
+# "nm" for the other formats. The fingerprint is None if they can't be read,
+# then the content of the library has to be compared instead.
+#
+# usage :
+#   fingerprint = noob.abi.getAbiFingerprint( "/path/to/libfoo.so" )
+
+ELF_MAGIC       = b"\x7fELF"
+SHT_DYNAMIC     = 6
+SHT_DYNSYM      = 11
+SHT_GNU_VERDEF  = 0x6ffffffd
+SHT_GNU_VERSYM  = 0x6fffffff
+DT_SONAME       = 14
+SHN_UNDEF       = 0
+STB_NAMES       = { 1 : "GLOBAL" , 2 : "WEAK" , 10 : "UNIQUE" }
+STT_NAMES       = { 0 : "NOTYPE" , 1 : "OBJECT" , 2 : "FUNC" , 5 : "COMMON" , 6 : "TLS" , 10 : "IFUNC" }
+STT_SIZED       = [ "OBJECT" , "COMMON" , "TLS" ] # the size of the data is part of the interface
+STV_EXPORTED    = [ 0 , 3 ] # default and protected visibilities
+
+
+class ElfReader( object ) :
+
+    def __init__( self , elfFile ) :
+        self.file = elfFile
+        ident     = self.read( 0 , 16 )
+        if ident[:4] != ELF_MAGIC : raise ValueError( "not an ELF file" )
+        self.is64   = ident[4] == 2
+        self.endian = "<" if ident[5] == 1 else ">"
+
+        # section headers
+        if self.is64 : fields = self.unpack( "HHIQQQIHHHHHH" , 16 )
+        else         : fields = self.unpack( "HHIIIIIHHHHHH" , 16 )
+        shoff , shentsize , shnum = fields[5] , fields[10] , fields[11]
+        shFormat      = "IIQQQQIIQQ" if self.is64 else "IIIIIIIIII"
+        self.sections = [ self.unpack( shFormat , shoff + i * shentsize ) for i in range( shnum ) ]
+
+
+    def read( self , offset , size ) :
+        self.file.seek( offset )
+        data = self.file.read( size )
+        if len( data ) != size : raise ValueError( "truncated ELF file" )
+        return data
+
+
+    def unpack( self , fieldFormat , offset ) :
+        fieldFormat = self.endian + fieldFormat
+        return struct.unpack( fieldFormat , self.read( offset , struct.calcsize( fieldFormat ) ) )
+
+
+    def findSection( self , sectionType ) :
+        # ( type , flags , address , offset , size , link , info , align , entry size ) are at [1:]
+        for section in self.sections :
+            if section[1] == sectionType : return section
+        return None
+
+
+    def readSection( self , section ) :
+        return self.read( section[4] , section[5] )
+
+
+    def getString( self , strings , offset ) :
+        return strings[ offset : strings.index( b"\0" , offset ) ].decode( "utf-8" , "surrogateescape" )
+
+
+    def getSoname( self ) :
+        dynamic = self.findSection( SHT_DYNAMIC )
+        if dynamic == None : return ""
+        strings    = self.readSection( self.sections[ dynamic[6] ] )
+        data       = self.readSection( dynamic )
+        tagFormat  = self.endian + ( "qQ" if self.is64 else "iI" )
+        for tag , value in struct.iter_unpack( tagFormat , data[ : len(data) - len(data) % struct.calcsize( tagFormat ) ] ) :
+            if tag == DT_SONAME : return self.getString( strings , value )
+        return ""
+
+
+    def getVersionNames( self , strings ) :
+        # version index -> name of the versions defined by this library
+        names  = {}
+        verdef = self.findSection( SHT_GNU_VERDEF )
+        if verdef == None : return names
+        data   = self.readSection( verdef )
+        offset = 0
+        for _ in range( verdef[7] ) : # sh_info : number of definitions
+            _ , _ , index , count , _ , auxOffset , nextOffset = struct.unpack_from( self.endian + "HHHHIII" , data , offset )
+            if count : names[ index ] = self.getString( strings , struct.unpack_from( self.endian + "I" , data , offset + auxOffset )[0] )
+            if not nextOffset : break
+            offset += nextOffset
+        return names
+
+
+    def getExportedSymbols( self ) :
+        dynsym = self.findSection( SHT_DYNSYM )
+        if dynsym == None : return []
+        strings  = self.readSection( self.sections[ dynsym[6] ] )
+        data     = self.readSection( dynsym )
+        versions = self.getVersionNames( strings )
+        versym   = self.findSection( SHT_GNU_VERSYM )
+        versym   = self.readSection( versym ) if versym != None else b""
+
+        symFormat = self.endian + ( "IBBHQQ" if self.is64 else "IIIBBH" )
+        symSize   = struct.calcsize( symFormat )
+        symbols   = []
+        for i in range( len( data ) // symSize ) :
+            if self.is64 : nameOffset , info , other , shndx , value , size = struct.unpack_from( symFormat , data , i * symSize )
+            else         : nameOffset , value , size , info , other , shndx = struct.unpack_from( symFormat , data , i * symSize )
+
+            binding = STB_NAMES.get( info >> 4 )
+            if shndx == SHN_UNDEF or not binding or other & 3 not in STV_EXPORTED : continue
+
+            symType = STT_NAMES.get( info & 0xf , str( info & 0xf ) )
+            name    = self.getString( strings , nameOffset )
+            if 2 * i + 2 <= len( versym ) :
+                versionIndex = struct.unpack_from( self.endian + "H" , versym , 2 * i )[0] & 0x7fff
+                if versionIndex in versions : name += "@" + versions[ versionIndex ]
+
+            symbols.append( " ".join( [ name , symType , binding ] + ( [ str( size ) ] if symType in STT_SIZED else [] ) ) )
+        return symbols
+
+
+def _readElfInterface( libPath ) :
+    with open( libPath , "rb" ) as libFile :
+        elf = ElfReader( libFile )
+        return [ "soname " + elf.getSoname() ] + sorted( elf.getExportedSymbols() )
+
+
+def _readNmInterface( libPath ) :
+    # "address type name" : the addresses change with any modification of the code
+    command = [ "nm" , "-g" , "-U" , libPath ] if sys.platform == "darwin" else [ "nm" , "-D" , "--defined-only" , libPath ]
+    process = subprocess.run( command , stdout = subprocess.PIPE , stderr = subprocess.PIPE )
+    if process.returncode != 0 : raise OSError( process.stderr.decode( errors = "replace" ).strip() )
+    lines   = process.stdout.decode( "utf-8" , "surrogateescape" ).splitlines()
+    return sorted( " ".join( line.split()[-2:] ) for line in lines if line.strip() )
+
+
+def computeAbiFingerprint( libPath ) :
+    try :
+        try :
+            interface = _readElfInterface( libPath )
+        except ValueError :
+            interface = _readNmInterface( libPath )
+    except ( OSError , ValueError , struct.error ) as e :
+        sys.stderr.write( "[WARNING] cannot read the exported symbols of '" + libPath + "' : " + str(e) + "\n" )
+        return ""
+    return hashlib.md5( "\n".join( interface ).encode( "utf-8" , "surrogateescape" ) ).hexdigest()
+
+
+def getAbiFingerprint( libPath ) :
+    # only computed again when the library has changed ( see noob.filetools.BuildCache )
+    fingerprint = noob.filetools.getBuildCache().getFileValue( "abi" , libPath , computeAbiFingerprint )
+    return fingerprint or None
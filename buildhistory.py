@@ -0,0 +1,95 @@
+import os , sys , json , threading
+
+
+# Persistent record of how long each build step took ( compilation of an
+# object, link of a target, swig wrapper generation ... ), keyed by the
+# path of the file the step produces. It is used to start the longest
+# tasks and the longest chains of dependent nodes first, and to display
+# the estimated remaining time of the build.
+#
+# The peak memory of the compilations is recorded as well, so the engine
+# doesn't start too many heavy compilations at once on a small machine.
+
+HISTORY_PATH = ".noob_history"
+
+
+class BuildHistory( object ) :
+
+    def __init__( self , historyPath = HISTORY_PATH ) :
+        self.historyPath = historyPath
+        self.lock        = threading.Lock()
+        self.durations   = {}
+        self.peakMemory  = {} # output path -> bytes
+        self.isModified  = False
+        self.load()
+
+
+    def load( self ) :
+        if not os.path.exists( self.historyPath ) : return
+        try :
+            with open( self.historyPath , "r" ) as historyFile :
+                history = json.load( historyFile )
+            
+            # the first versions only recorded the durations
+            if "durations" not in history : history = { "durations" : history }
+            self.durations  = history[ "durations" ]
+            self.peakMemory = history.get( "peak_memory" , {} )
+        except ( OSError , ValueError , TypeError ) as e :
+            # a corrupted history only costs a badly ordered build
+            sys.stderr.write( "[WARNING] build history '" + self.historyPath + "' ignored : " + str(e) + "\n" )
+            self.durations  = {}
+            self.peakMemory = {}
+
+
+    def save( self ) :
+        with self.lock :
+            if not self.isModified : return
+
+            # write in a temporary file first, so the history is never left half-written
+            tmpPath = self.historyPath + ".tmp"
+            with open( tmpPath , "w" ) as historyFile :
+                json.dump( { "durations" : self.durations , "peak_memory" : self.peakMemory } , historyFile )
+            os.replace( tmpPath , self.historyPath )
+            self.isModified = False
+
+
+    def record( self , outputPath , duration ) :
+        # smooth the measures to absorb the noise of a loaded machine
+        with self.lock :
+            previousDuration = self.durations.get( outputPath )
+            if previousDuration != None : duration = 0.5 * previousDuration + 0.5 * duration
+            self.durations[ outputPath ] = round( duration , 3 )
+            self.isModified = True
+
+
+    def estimate( self , outputPath , default = None ) :
+        return self.durations.get( outputPath , default )
+
+
+    def recordPeakMemory( self , outputPath , peakMemory ) :
+        # the last measure is kept : unlike the duration, it barely depends on the load
+        with self.lock :
+            self.peakMemory[ outputPath ] = int( peakMemory )
+            self.isModified = True
+
+
+    def estimatePeakMemory( self , outputPath , default = None ) :
+        return self.peakMemory.get( outputPath , default )
+
+
+_buildHistory     = None
+_buildHistoryLock = threading.Lock()
+
+def getBuildHistory( ) :
+    global _buildHistory
+    with _buildHistoryLock :
+        if _buildHistory == None : _buildHistory = BuildHistory()
+        return _buildHistory
+
+
+def formatDuration( seconds ) :
+    hours   , remainder = divmod( int( seconds ) , 3600 )
+    minutes , seconds   = divmod( remainder , 60 )
+    if hours : return "%.2dh:%.2dm:%.2ds" % ( hours , minutes , seconds )
+    return "%.2dm:%.2ds" % ( minutes , seconds )
+
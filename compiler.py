@@ -1,4 +1,4 @@
-import subprocess , sys
+import subprocess , sys , os , shutil , hashlib , threading
 
 # This file registers all well-known compilers in a single dict with the format
 # KNOWN_COMPILERS[ OSName ][ compilerName_bitness ] ( ex KNOWN_COMPILERS["windows"]["msvc2008_32"] )
@@ -70,7 +70,14 @@ for msvcVer in [ "msvc2008" , "msvc2012" , "msvc2013" , "msvc2015" ] :
             "static_link_cmd"    : "lib.exe /NOLOGO /OUT:$(OUT) $(IN) $(FLAGS)"                       ,
             "exe_link_cmd"       : "link.exe /NOLOGO $(IN) /OUT:$(OUT) $(FLAGS)"                      ,
             "incs_prefix"        : "-I"                                                               ,                                                         
-            "incs_system_prefix" : "-I"       # no -isystem on Windows                                                     
+            "incs_system_prefix" : "-I"                                                               , # no -isystem on Windows                                                     
+            "dep_flags"          : "/showIncludes"                                                    , # headers listed on stdout
+            "response_file"      : "msvc"                                                             , # format of the "@file" arguments
+            "lto_flags"          : "/GL"                                                              , # whole program optimization
+            "lto_link_flags"     : "/LTCG"                                                            ,
+            "pch_suffix"         : ".pch"                                                             , # precompiled headers : $(PCH) header , $(PCH_OUT) precompiled file
+            "pch_create_flags"   : "/Yc$(PCH) /Fp$(PCH_OUT)"                                          , # given to a source including $(PCH), whose object is linked
+            "pch_use_flags"      : "/Yu$(PCH) /FI$(PCH) /Fp$(PCH_OUT)"                                  
         }
         
         
@@ -86,9 +93,19 @@ KNOWN_COMPILERS["macOS"]["g++_64"] = {
     "c_obj_cmd"                : "gcc -c $(IN) -o $(OUT) $(FLAGS)"                     ,
     "dynamic_link_cmd"         : "g++ $(IN) -o $(OUT) $(FLAGS) -headerpad_max_install_names -arch x86_64 -single_module -dynamiclib",
     "static_link_cmd"          : "ar qcs $(OUT) $(IN) $(FLAGS)"                        , # "ar rcs $(OUT) $(IN) $(FLAGS)",
+    "static_update_cmd"        : "ar rcs $(OUT) $(IN) $(FLAGS)"                        , # replace or add members
+    "static_remove_cmd"        : "ar d $(OUT) $(IN)"                                   , # remove members, given by name
     "exe_link_cmd"             : "g++ $(IN) -o $(OUT) $(FLAGS)"                        ,
     "incs_prefix"              : "-iquote"                                             ,
-    "incs_system_prefix"       : "-isystem"                                                
+    "incs_system_prefix"       : "-isystem"                                            ,
+    "dep_flags"                : "-MMD -MF $(DEP)"                                     ,
+    "pch_dep_flags"            : "-MD -MF $(DEP)"                                      , # with the system headers
+    "linker_flags"             : "-fuse-ld=$(LINKER)"                                  , # node option 'linker'
+    "linker_check_flags"       : "-Wl,-v"                                              , # succeeds if the linker can be run
+    "lto_flags"                : "-flto"                                               ,
+    "lto_link_flags"           : "-flto"                                               ,
+    "pch_suffix"               : ".gch"                                                , # precompiled headers, see the linux configuration
+    "pch_use_flags"            : "-include $(PCH) -Winvalid-pch"                         
 }
 
 
@@ -102,9 +119,25 @@ KNOWN_COMPILERS["linux"]["g++_64"] = {
     "c_obj_cmd"                : "g++ -c $(IN) -o $(OUT) $(FLAGS)"       ,
     "dynamic_link_cmd"         : "g++ -shared $(IN) -o $(OUT) $(FLAGS)"  ,
     "static_link_cmd"          : "ar qcs $(OUT) $(IN) $(FLAGS)"          ,
+    "static_update_cmd"        : "ar rcs $(OUT) $(IN) $(FLAGS)"          , # replace or add members
+    "static_remove_cmd"        : "ar d $(OUT) $(IN)"                     , # remove members, given by name
+    "static_thin_link_cmd"     : "ar qcsT $(OUT) $(IN) $(FLAGS)"         , # thin archives : references to the objects
+    "static_thin_update_cmd"   : "ar rcsT $(OUT) $(IN) $(FLAGS)"         ,
+    "static_thin_remove_cmd"   : "ar dP $(OUT) $(IN)"                    , # remove members, given by their full path
     "exe_link_cmd"             : "g++ -lstdc++ $(IN) -o $(OUT) $(FLAGS)" ,
     "incs_prefix"              : "-iquote"                               ,    
-    "incs_system_prefix"       : "-isystem"                                    
+    "incs_system_prefix"       : "-isystem"                              ,
+    "dep_flags"                : "-MMD -MF $(DEP)"                       ,
+    "pch_dep_flags"            : "-MD -MF $(DEP)"                        , # headers of the precompiled header, with the system ones
+    "response_file"            : "gcc"                                   ,
+    "linker_flags"             : "-fuse-ld=$(LINKER)"                    , # node option 'linker' : "lld" , "mold" , "gold" , "bfd"
+    "linker_check_flags"       : "-Wl,--version"                         , # succeeds if the linker can be run
+    "split_dwarf_flags"        : "-gsplit-dwarf"                         , # debug info in .dwo files, not given to the linker
+    "lto_flags"                : "-flto"                                 ,
+    "lto_link_flags"           : "-flto=$(JOBS)"                         , # $(JOBS) : job slots given to the link ( see noob.engine )
+    "lto_ar"                   : "gcc-ar"                                , # archiver keeping the symbols of the LTO objects
+    "pch_suffix"               : ".gch"                                  , # precompiled headers : $(PCH) header compiled to $(PCH) + pch_suffix,
+    "pch_use_flags"            : "-include $(PCH) -Winvalid-pch"           # used instead of $(PCH) by the sources
 }
 
 
@@ -184,3 +217,56 @@ if DETECTED_COMPILER == None :
     sys.stderr.write( "[WARNING] Compiler auto-detection failed\n\n" )
     
     
+# identity of the compiler executables, computed once : 
+# path , size and modification time of the executable and its version banner
+_compilerIdentities     = {}
+_compilerIdentitiesLock = threading.Lock()
+
+def getCompilerIdentity( executable , environment = None ) :
+    searchPath = environment.get( "PATH" ) if environment else None
+    with _compilerIdentitiesLock :
+        if ( executable , searchPath ) in _compilerIdentities : 
+            return _compilerIdentities[ ( executable , searchPath ) ]
+    
+    identity = executable
+    path     = shutil.which( executable , path = searchPath )
+    if path :
+        stat      = os.stat( path )
+        identity  = path + ":" + str( stat.st_size ) + ":" + str( stat.st_mtime_ns )
+        try :
+            # cl.exe doesn't know --version but prints its banner on stderr anyway
+            process             = subprocess.Popen( [ path , "--version" ] , stdout = subprocess.PIPE , stderr = subprocess.PIPE , env = environment )
+            ( stdout , stderr ) = process.communicate( timeout = 30 )
+            identity           += ":" + hashlib.md5( stdout + stderr ).hexdigest()
+        except ( OSError , subprocess.TimeoutExpired ) :
+            pass
+    
+    with _compilerIdentitiesLock :
+        _compilerIdentities[ ( executable , searchPath ) ] = identity
+    return identity
+    
+    
+# whether a command succeeds, checked once : used to know if an optional
+# tool ( another linker , gcc-ar ... ) can be used before adding it to a build
+_availableTools     = {}
+_availableToolsLock = threading.Lock()
+
+def isToolAvailable( command , environment = None ) :
+    searchPath = environment.get( "PATH" ) if environment else None
+    key        = ( tuple( command ) , searchPath )
+    with _availableToolsLock :
+        if key in _availableTools : return _availableTools[ key ]
+    
+    isAvailable = False
+    path        = shutil.which( command[0] , path = searchPath )
+    if path :
+        try :
+            process     = subprocess.run( [ path ] + list( command[1:] ) , stdin = subprocess.DEVNULL , stdout = subprocess.PIPE , stderr = subprocess.PIPE , env = environment , timeout = 30 )
+            isAvailable = process.returncode == 0
+        except ( OSError , subprocess.TimeoutExpired ) :
+            pass
+    
+    with _availableToolsLock :
+        _availableTools[ key ] = isAvailable
+    return isAvailable
+    
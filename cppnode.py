@@ -1,20 +1,18 @@
-import os , subprocess , sys ,  hashlib , shlex , inspect, datetime
+import os , subprocess , sys ,  hashlib , shlex , inspect, datetime , time , json , mmap , filecmp , shutil
 import noob.compiler
 import noob.node
 import noob.filetools
+import noob.jobserver
+import noob.buildhistory
+import noob.objcache
+import noob.engine
+import noob.abi
 import concurrent.futures
 import asyncio
 import re
 from functools import partial
 import threading 
 
-        
-modifiedLock     = threading.Lock()
-modifiedLockDict = {} 
-modifiedCache    = {} 
-mtimeLock        = threading.Lock()
-mtimeLockDict    = {}
-mtimeCache       = {} 
 
 
 # examples of custom display functions
@@ -46,6 +44,57 @@ def checkCmd( cmd , *keywords ):
     return True
     
 
+def quoteResponseFileArgs( args , rspFormat ) :
+    # content of a response file giving args to a command. 'msvc' : quoted as
+    # on a Windows command line ; 'gcc' : quotes and backslashes are escaped
+    if rspFormat == "msvc" : return subprocess.list2cmdline( args ) + "\n"
+    
+    quotedArgs = []
+    for arg in args :
+        if arg and not re.search( r'[\s"\'\\]' , arg ) : quotedArgs.append( arg )
+        else : quotedArgs.append( '"' + arg.replace( "\\" , "\\\\" ).replace( '"' , '\\"' ) + '"' )
+    return "\n".join( quotedArgs ) + "\n"
+    
+
+def uniqueList( items ) :
+    # remove the duplicates and keep the first occurrence of each item : unlike 
+    # a set, the order of the flags is the same from a run to another
+    return list( dict.fromkeys( items ) )
+    
+
+# '#include "..."' directives, matched on the raw bytes of a file
+INCLUDE_PATTERN = re.compile( rb'^[ \t]*#[ \t]*include[ \t]*"([^"\r\n]+)"' , re.MULTILINE )
+
+def scanIncludes( filePath ) :
+    # names included with '#include "..."' in filePath, found 
+    # with a single scan of the file mapped in memory
+    with open( filePath , "rb" ) as f :
+        if os.fstat( f.fileno() ).st_size == 0 : return [] # can't map an empty file
+        with mmap.mmap( f.fileno() , 0 , access = mmap.ACCESS_READ ) as content :
+            return [ inc.decode( "latin1" ) for inc in INCLUDE_PATTERN.findall( content ) ]
+    
+
+def parseMakeDependencies( content ) :
+    # prerequisites of the rule written by "gcc -MMD -MF", ex : 
+    #   /path/to/file.o: /path/to/file.cc /path/to/my\ header.h \
+    #    /path/to/other.h
+    content          = content.replace( "\\\r\n" , " " ).replace( "\\\n" , " " )
+    _ , _ , prereqs  = content.split( "\n" )[0].partition( ": " )
+    return [ p.replace( "\\ " , " " ).replace( "\\#" , "#" ).replace( "$$" , "$" ) for p in re.findall( r'(?:\\ |[^ \t])+' , prereqs ) ]
+    
+
+def parseShowIncludes( output ) :
+    # split the output of "cl.exe /showIncludes" between the included
+    # headers and the other messages
+    includePattern = re.compile( r'^Note: including file:\s*(.+?)\s*$' )
+    headers , lines = [] , []
+    for line in output.splitlines() :
+        m = includePattern.match( line )
+        if m : headers.append( m.group(1) )
+        else : lines  .append( line )
+    return headers , "\n".join( lines )
+    
+
 # Base class for ExeNode, DynamicLibNode and StaticLibNode
 class _CppNode( noob.node.Node ) :
     
@@ -63,11 +112,35 @@ class _CppNode( noob.node.Node ) :
         self.dest_dir      = "." 
         self.tmp_dir       = "."
         self.extern_libs   = [] # internal property . ex : [ {'lib_name' :'jpeg' , 'incs':'/dir/to/jpeg' , 'libs' : ['/path/to/jpeg.a'] } , {... other lib ... } ]" ,
-        self.num_thread    = 8
+        self.num_thread    = "auto" # or a number
         self.stop_on_error = True
-        self.diff_method   = "mtime" # or "md5"
+        self.diff_method   = "mtime" # or "md5" or "hybrid"
+        self.hash_algorithm = "md5"
+        self.dep_method     = "scan"
         self.display_mode  = 'normal'
         
+        # shared cache of compiled objects ( None : disabled )
+        self.obj_cache_dir      = None
+        self.obj_cache_max_size = 5 * 1024**3
+        self.obj_cache_url       = None
+        self.obj_cache_read_only = False
+        self.obj_cache_timeout   = 5.
+        self.obj_cache_base_dir  = None # directory of the calling script
+        
+        # length above which the arguments of a command are given in a response file
+        self.response_file_threshold = 30000
+        
+        # toolchain options, ignored with a warning if the compiler configuration doesn't know them
+        self.linker      = None  # ex : "lld" , "mold" , "gold"
+        self.split_dwarf = False
+        self.lto         = False
+        
+        # unity build : sources compiled by batches of about this size ( 0 : disabled )
+        self.unity_batch_size = 0
+        
+        # header precompiled before the objects and included by all the C++ sources ( None : disabled )
+        self.pch = None
+        
         # functions to format output messages
         self.obj_display_func  = None
         self.link_display_func = None
@@ -83,14 +156,41 @@ class _CppNode( noob.node.Node ) :
             "tmp_dir"           : "Temporary directory, where temporary objects (.o) will be built. ex : '/my/tmp/dir' "                 , 
             "obj_display_func"  : "Format function for compiling output messages , ex : def objDisplay( commandList , sourcePath , oFilePath , ccFlags , includes , progress ) " ,
             "link_display_func" : "Format function for linking output messages   , ex : def linkDisplay( commandList , targetPath , ldFlags , libs )",
-            "num_thread"        : "Number of thread to use for compilation, equivalent to -j make option ( default : 8 )"                ,
+            "num_thread"        : "Number of thread to use for compilation of this node, sub-processes are also bounded by 'max_jobs'. 'auto' : as many as 'max_jobs' ( default : 'auto' )" ,
             "stop_on_error"     : "Stop immediately if an error is found during compilation ( default : True )"                          ,
-            "diff_method"       : "Method to check if a file has been modified : 'mtime' (=fast) or 'md5' (=slow) ( default : 'mtime' )" , 
-            "display_mode"      : "Format of the output messages 'normal' or 'concise' ( default : 'normal' )"  
+            "diff_method"       : "Method to check if a file has been modified : 'mtime' (=fast), 'md5' (=slow, content hash) or 'hybrid' (content hash only computed again when mtime, size or inode changed) ( default : 'mtime' )" , 
+            "dep_method"        : "Method to find the headers of a source : 'scan' ( parse the '#include \"...\"' directives ) or 'depfile' ( exact list given by the compiler at each compilation, only checked afterwards ) ( default : 'scan' )" ,
+            "hash_algorithm"    : "Hash algorithm of the 'md5' and 'hybrid' diff methods, any name known by hashlib. ex : 'blake2b' ( default : 'md5' )" ,
+            "display_mode"      : "Format of the output messages 'normal' or 'concise' ( default : 'normal' )"  ,
+            "obj_cache_dir"     : "Directory of a cache of compiled objects shared between nodes and builds, indexed by the content of the sources, of the headers and by the command. ex : '~/.noob_objcache' ( default : None = disabled )" ,
+            "obj_cache_max_size": "Maximum size in bytes of the object cache, least recently used objects are evicted first ( default : 5 GB )" ,
+            "obj_cache_url"     : "URL of a remote object cache shared by a team ( see noob.objcacheserver ), backing 'obj_cache_dir' or used alone. ex : 'http://myserver:8080' ( default : None = disabled )" ,
+            "obj_cache_read_only" : "Only download from the remote object cache, never upload to it ( default : False )" ,
+            "obj_cache_timeout" : "Timeout in seconds of the requests to the remote object cache, which is disabled for the build after a failure ( default : 5 )" ,
+            "obj_cache_base_dir": "Root of the project : the paths under it are relative in the keys of the object cache, so checkouts at different places share their objects. The restored objects keep the paths of the checkout they were compiled in ( debug information ... ) ( default : directory of the calling script )" ,
+            "response_file_threshold" : "Length in characters of a compilation or link command above which its arguments are written in a response file '@file' ( default : 30000 , 0 = never )" ,
+            "linker"            : "Linker used by the compiler, ex : 'lld' , 'mold' , 'gold' , 'bfd'. The default one is used if it isn't found ( default : None = default linker )" ,
+            "split_dwarf"       : "Write the debug info of the objects in separate .dwo files, not read by the linker. The object cache isn't used ( default : False )" ,
+            "lto"               : "Link time optimization, the link uses as many job slots as free. The nodes linked against a static library with 'lto' need it too ( default : False )" ,
+            "unity_batch_size"  : "Unity build : compile the sources by batches of about this size, each included by a file generated in 'tmp_dir'. The sources edited recently are compiled alone ( default : 0 = disabled )" ,
+            "pch"               : "Header precompiled with the C++ flags of this node before its objects, and included first by all its C++ sources. ex : './prelude.h' ( default : None = disabled )"
         } )
         
         
         self.cancelAll   = False # shared between coroutines to stop compilation if needed
+        
+        # object commands of this node split once per build, see getObjCommandTemplate()
+        self._objCommandTemplates = {}
+        
+        # content of the precompiled header and of its headers in this build, see buildPch()
+        self._pchStamp = ""
+        
+        # toolchain options already warned about, see _warnToolchain()
+        self._toolchainWarnings = set()
+        
+        # estimated duration of the objects not compiled yet, to display the remaining time
+        self._remainingDuration     = 0.
+        self._remainingDurationLock = threading.Lock()
     
     def name( self )  :
         return str( self.targets()[0] ) 
@@ -116,15 +216,23 @@ class _CppNode( noob.node.Node ) :
         return self._compiler
         
         
-    def build( self ) :
-        noob.node.Node.execute( self )
+    def build( self , **kwargs ) :
+        noob.node.Node.execute( self , **kwargs )
     
     def cleanObjects( self ) :
         
-        # remove object files 
-        for src in self.srcs :
+        # remove object files, and the unity and precompiled header files
+        generatedPaths = [ unityPath for unityPath , _ in self.getUnityBatches() ]
+        if self.pch :
+            generatedPaths.append( self.getPchPaths()[0] )
+            noob.filetools.rmFile( self.getPchPaths()[1] )
+        for generatedPath in generatedPaths : noob.filetools.rmFile( generatedPath )
+        for src in self.srcs + generatedPaths :
             objPath = self.getObjectPath( src )
             noob.filetools.rmFile( objPath )
+            noob.filetools.rmFile( objPath + ".rsp" )
+            noob.filetools.rmFile( objPath + ".dwo" )
+        noob.filetools.rmFile( self.getLinkResponseFilePath() )
             
         # remove temporary directory if it's empty
         noob.filetools.rmDir( self.tmp_dir )
@@ -169,11 +277,14 @@ class _CppNode( noob.node.Node ) :
         # setting of parameters
         for k,v in params.items() :
             # always make paths absolute, based on the current calling path
-            if k in [ "srcs" , "incs" , "libs" , "dest_dir" , "tmp_dir" ] : 
+            if k in [ "srcs" , "incs" , "libs" , "dest_dir" , "tmp_dir" , "pch" , "obj_cache_base_dir" ] : 
                 setattr( self , k , noob.filetools.makeAbsolutePath( params["calling_path"] , params[k] ) )
             else : 
                 setattr( self , k , v )
         
+        if self.obj_cache_base_dir == None : 
+            self.obj_cache_base_dir = noob.filetools.makeAbsolutePath( params["calling_path"] , "." )
+        
     
     def displayAllowedParameters( self )  :
         print("\n--- Allowed parameters for node '" + self.name() + "'" ) 
@@ -231,115 +342,162 @@ class _CppNode( noob.node.Node ) :
         
 
     def getObjectPath( self , sourcePath ) :
+        # the header including pch is compiled to the precompiled header ( gcc )
+        if self.pch and sourcePath == self.getPchPaths()[0] and not self.isPchCompiledFromSource() : return self.getPchPaths()[1]
         oFileName  = os.path.basename( sourcePath )
         oFileName  = oFileName.split(".")[0]
         oFileName += noob.compiler.DETECTED_PLATFORM["obj_suffix"] 
         oFilePath  = os.path.join( self.tmp_dir , oFileName )
         return oFilePath
     
+    def getLinkResponseFilePath( self ) :
+        return os.path.join( self.tmp_dir , os.path.basename( self.targets()[0] ) + ".rsp" )
+    
+    def getAbsoluteObjectPath( self , sourcePath ) :
+        oFilePath = self.getObjectPath( sourcePath )
+        if not os.path.isabs( oFilePath ):
+            oFilePath = os.path.realpath( os.path.join( os.getcwd() , oFilePath ) ) 
+        return oFilePath
+    
 
+    def getInterface( self ) :
+        
+        # usage requirements of this node, computed once per build :
+        #  - "public"  : what the nodes depending on this one inherit 
+        #  - "private" : what only this node uses, on top of what it inherits
+        # The includes are given as ( directory , is system ) to keep their order
+        session   = self.getSession()
+        interface = session.interfaces.get( self )
+        if interface != None : return interface
+        
+        public  = { "includes" : [] , "cc_flags" : [] , "ld_flags" : [] , "libs" : [] }
+        private = { "includes" : [] , "cc_flags" : [] , "ld_flags" : [] , "libs" : [] }
+        
+        # include files of this node and of its external libraries
+        if self.nodeType in [ "Dynamic Library" , "Static Library" , "Swig Library" ] :
+            public["includes"] += [ ( i , False ) for i in self.incs        ]
+            public["includes"] += [ ( i , True  ) for i in self.incs_system ]
+            for extLib in self.extern_libs :
+                public["includes"] += [ ( i , False ) for i in extLib["incs"       ] ]
+                public["includes"] += [ ( i , True  ) for i in extLib["incs_system"] ]
+        
+        # compiler flags of this node, the ones of its external libraries aren't inherited.
+        # Linker flags and libraries of this node and of its external libraries
+        if self.nodeType in [ "Dynamic Library" , "Static Library" ] :
+            public["cc_flags"] += self.cc_flags
+            public["ld_flags"] += self.ld_flags
+            public["libs"    ] += self.targets()
+            for extLib in self.extern_libs :
+                public["ld_flags"] += extLib["ld_flags"]
+                public["libs"    ] += extLib["libs"    ]
+        
+        # this node's external libraries 
+        for extLib in self.extern_libs :
+            private["includes"] += [ ( i , False ) for i in extLib["incs"       ] ]
+            private["includes"] += [ ( i , True  ) for i in extLib["incs_system"] ]
+            private["cc_flags"] += extLib["cc_flags"]
+            private["ld_flags"] += extLib["ld_flags"]
+            private["libs"    ] += extLib["libs"    ]
+        
+        interface = { "public" : public , "private" : private }
+        session.interfaces.set( self , interface )
+        return interface
+        
+        
+    def getUsageRequirements( self , dependentNodeList ) :
+        
+        # public interfaces of the nodes this node depends on, combined with this node's
+        # private interface. Computed once per build, instead of for every source and every link :
+        #  - includes and compiler flags in the order of dependentNodeList ( topological order ),
+        #    then the ones of this node
+        #  - libraries and linker flags in the reverse order, after the ones of this node : a static
+        #    library is linked before the ones it depends on. A library used by several nodes is 
+        #    kept at its last position, after all of them
+        session      = self.getSession()
+        key          = ( self , tuple( dependentNodeList ) )
+        requirements = session.requirements.get( key )
+        if requirements != None : return requirements
+        
+        interfaces   = [ node.getInterface()["public"] for node in dependentNodeList if isinstance( node , _CppNode ) ]
+        private      = self.getInterface()["private"]
+        requirements = {}
+        for name in [ "includes" , "cc_flags" ] :
+            requirements[name] = uniqueList( value for interface in interfaces + [ private ] for value in interface[name] )
+        for name in [ "ld_flags" , "libs" ] :
+            values             = [ value for interface in [ private ] + interfaces[::-1] for value in interface[name] ]
+            requirements[name] = uniqueList( values[::-1] )[::-1]
+        
+        session.requirements.set( key , requirements )
+        return requirements
+        
+        
     def getAutomaticIncludes( self , dependentNodeList , incs_prefix = None ):
         
         # retrieve all include files of this node and inherited from the others as well 
-        
-        # list of include files to return in an list formatted as so : [ "-I/my/include/path" , "-I/other/inc" , ... ]
-        automatic_includes = []
+        # in an list formatted as so : [ "-I/my/include/path" , "-I/other/inc" , ... ]
         
         # get the include prefix ( compiler dependant )
         incPrefix        = incs_prefix if incs_prefix else self._getCompiler()["incs_prefix"       ]  
         incPrefix_system = incs_prefix if incs_prefix else self._getCompiler()["incs_system_prefix"]  
         
-        # add include files inherited from the other library nodes
-        for node in dependentNodeList :
-            if node.nodeType in [ "Dynamic Library" , "Static Library" , "Swig Library" ]:
-                
-                # include files from the other library nodes
-                automatic_includes += [ incPrefix        + i for i in node.incs        ]
-                automatic_includes += [ incPrefix_system + i for i in node.incs_system ]
-                
-                # include files from external libraries of the other nodes
-                for extLib in node.extern_libs :
-                    automatic_includes += [ incPrefix        + i for i in extLib["incs"       ] ]
-                    automatic_includes += [ incPrefix_system + i for i in extLib["incs_system"] ]
-        
-        # add this node's extern libraries 
-        for extLib in self.extern_libs :
-            automatic_includes += [ incPrefix + i for i in extLib["incs"] ]
-            automatic_includes += [ incPrefix_system + i for i in extLib["incs_system"] ]
-          
-        return list( set( automatic_includes ) )
+        includes = self.getUsageRequirements( dependentNodeList )["includes"]
+        return uniqueList( ( incPrefix_system if isSystem else incPrefix ) + i for i , isSystem in includes )
     
        
     def getAutomaticCcFlags( self , dependentNodeList ):
         
         # compiler flags to return in a list formatted as so : [ "-DDEBUG" , "-g" , "-O3" , ... ]
-        automatic_ccflags = []
-        
-        # add compiler flags inherited from the other nodes : 
-        for node in dependentNodeList :
-            if node.nodeType in [ "Dynamic Library" , "Static Library" ]:
-                automatic_ccflags += node.cc_flags
-                
-        # add compiler flags from this node's external libraries 
-        for extLib in self.extern_libs :
-            automatic_ccflags += extLib["cc_flags"] 
-        
-        return list( set( automatic_ccflags ) )
+        return self.getUsageRequirements( dependentNodeList )["cc_flags"][:]
         
         
     def getAutomaticLdFlags( self , dependentNodeList ) :
         
         # retrieve all linker flags of this node and inherited from the others as well  
         # and return a list of linker flags of the form : [ "-nostdlib" , "-s" , ... ]
-        automatic_ldflags = []
-        
-        # add linker flags inherited from the other nodes
-        for node in dependentNodeList:
-            
-            if node.nodeType in [ "Dynamic Library" , "Static Library" ]:
-                # flags from the other library nodes to inherit
-                automatic_ldflags += node.ld_flags 
-            
-                # flags from external libraries of the other nodes to inherit
-                for extLib in node.extern_libs :
-                    automatic_ldflags += extLib[ "ld_flags" ]
-                            
-        # add linker flags of this node's external libraries 
-        for extLib in self.extern_libs :
-            automatic_ldflags += extLib["ld_flags"] 
-        
-        return list( set( automatic_ldflags ) )
+        return self.getUsageRequirements( dependentNodeList )["ld_flags"][:]
     
         
     def getAutomaticLibs( self , dependentNodeList ):
         # retrieve all linker flags of library of this node and inherited from the others as well  
         # and return a list of linker flags of the form : [ "-lmylib" , "-L/my/path" , "/path/to/static.a" , ... ]
         # used to simplify the definition of dependent libraries
+        return self.getUsageRequirements( dependentNodeList )["libs"][:]
+   
+   
+    def getResponseFileCommand( self , command , rspPath ) :
+        
+        # command to run instead of command : its executable and a response file "@rspPath"
+        # holding its arguments, when it is longer than response_file_threshold. The file is
+        # only written when its content changes. The cache always records command itself.
+        # The arguments with "$(JOBS)" stay on the command line, to be replaced by the engine
+        rspFormat = self._getCompiler().get( "response_file" )
+        if not rspFormat or self.response_file_threshold <= 0 : return command
+        if sum( len( c ) + 1 for c in command ) <= self.response_file_threshold : return command
+        
+        # msvc reads UTF-16 files with a BOM, gcc reads the bytes as they are
+        jobsArgs = [ c for c in command[1:] if "$(JOBS)" in c ]
+        content  = quoteResponseFileArgs( [ c for c in command[1:] if "$(JOBS)" not in c ] , rspFormat )
+        encoding , errors = ( "utf-16" , "strict" ) if rspFormat == "msvc" else ( "utf-8" , "surrogateescape" )
+        try :
+            with open( rspPath , "r" , encoding = encoding , errors = errors , newline = "" ) as rspFile :
+                isUpToDate = rspFile.read() == content
+        except ( OSError , UnicodeError ) :
+            isUpToDate = False
         
-        automatic_libs = []
-        for node in dependentNodeList :
-            
-            # add inherited libraries and their external libraries
-            if node.nodeType in [ "Dynamic Library" , "Static Library" ]:
-                
-                # add inherited libraries
-                #automatic_libs += node.libs
-                
-                # add this library dependency
-                automatic_libs += node.targets()
-                
-                # add inherited external libraries of this inherited node
-                for extLib in node.extern_libs :
-                    automatic_libs += extLib["libs"]
+        if not isUpToDate :
+            with open( rspPath , "w" , encoding = encoding , errors = errors , newline = "" ) as rspFile :
+                rspFile.write( content )
         
-        # add external libraries of this node's external libraries 
-        for extLib in self.extern_libs :
-            automatic_libs += extLib["libs"]
+        return [ command[0] ] + jobsArgs + [ "@" + rspPath ]
         
-        return list( set( automatic_libs ) )
-   
-   
-    def getObjCommand( self, sourcePath , oFilePath , dependentNodeList ):
+        
+    def getObjCommandTemplate( self , cmdName , dependentNodeList ) :
+        
+        # the object command cmdName ( "c++_obj_cmd" or "c_obj_cmd" ) of this node, split
+        # in a list of ( token , keyword to substitute ) with the flags already in place.
+        # It is computed once per build : only $(IN) and $(OUT) change from a source to another
+        template = self._objCommandTemplates.get( cmdName )
+        if template != None : return template
         
         # get include files of this node
         incs  = [ self._getCompiler()["incs_prefix"       ] + i for i in self.incs        ]
@@ -351,41 +509,57 @@ class _CppNode( noob.node.Node ) :
         # retrieve inherited compiler flags from the other nodes
         auto_ccflags = self.getAutomaticCcFlags( dependentNodeList )
          
-        # format those flags in a list
-        allFlags  = incs[:]
-        allFlags += self.cc_flags
-        allFlags += auto_ccflags
-        allFlags += auto_includes
-        allFlags  = list( set( allFlags ) ) # remove duplicates
-        # object command generation
-        cmd = ""
-        if sourcePath.endswith(".cc") or sourcePath.endswith(".cpp") : cmd  = self._getCompiler()["c++_obj_cmd"]
-        else                                                         : cmd  = self._getCompiler()["c_obj_cmd"  ]
+        # format those flags in a list, without duplicates
+        allFlags = uniqueList( incs + self.cc_flags + self.getToolchainCcFlags() + auto_ccflags + auto_includes )
         
         # check the command format correctness
+        cmd = self._getCompiler()[ cmdName ]
         if not checkCmd( cmd , "$(IN)" , "$(OUT)" , "$(FLAGS)" ) : 
             raise AssertionError( "Misformed obj_cmd : missing either $(IN) , $(OUT) or $(FLAGS)")
         
         # split the command string to convert it in a list of options
-        # substitute all keywords in the command with the proper values
-        cmd_res = []
+        # and substitute the flags
+        tokens = []
         for tok in shlex.split( cmd ):
-            if   "$(IN)"    in tok : cmd_res.append( tok.replace( "$(IN)"  , sourcePath ) )
-            elif "$(OUT)"   in tok : cmd_res.append( tok.replace( "$(OUT)" , oFilePath  ) )
-            elif "$(FLAGS)" in tok : cmd_res.extend( allFlags )
-            else                   : cmd_res.append( tok )
+            if   "$(IN)"    in tok : tokens.append( ( tok , "$(IN)"  ) )
+            elif "$(OUT)"   in tok : tokens.append( ( tok , "$(OUT)" ) )
+            elif "$(FLAGS)" in tok : tokens.extend( ( f , None ) for f in allFlags )
+            else                   : tokens.append( ( tok , None ) )
         
-        return cmd_res , list( set( self.cc_flags + auto_ccflags ) )  , list( set( incs + auto_includes ) )
+        template = ( tokens , uniqueList( self.cc_flags + self.getToolchainCcFlags() + auto_ccflags ) , uniqueList( incs + auto_includes ) )
+        self._objCommandTemplates[ cmdName ] = template
+        return template
+        
+        
+    def getObjCommandName( self , sourcePath ) :
+        if sourcePath.endswith(".cc") or sourcePath.endswith(".cpp") : return "c++_obj_cmd"
+        elif self.pch and sourcePath == self.getPchPaths()[0]        : return "c++_obj_cmd"
+        else                                                         : return "c_obj_cmd"
+        
+        
+    def getObjCommand( self, sourcePath , oFilePath , dependentNodeList ):
+        
+        # object command generation
+        cmdName = self.getObjCommandName( sourcePath )
+        tokens , ccFlags , includes = self.getObjCommandTemplate( cmdName , dependentNodeList )
+        
+        # substitute the source and the object in the command
+        values  = { "$(IN)" : sourcePath , "$(OUT)" : oFilePath }
+        cmd_res = [ tok.replace( keyword , values[ keyword ] ) if keyword else tok for tok , keyword in tokens ]
+        if cmdName == "c++_obj_cmd" : cmd_res += self.getPchFlags( sourcePath )
+        
+        return cmd_res , ccFlags[:] , includes[:]
         
         
     
-    def getLinkCommand( self , objs , targetPath , dependentNodeList ) :
+    def getLinkCommand( self , objs , targetPath , dependentNodeList , cmdName = None ) :
         
-        # generate the link command
+        # generate the link command, or the command cmdName of the compiler configuration
         cmd = ""
-        if   self.nodeType == "Executable"      : cmd = self._getCompiler()["exe_link_cmd"    ]
+        if   cmdName                            : cmd = self._getCompiler()[cmdName           ]
+        elif self.nodeType == "Executable"      : cmd = self._getCompiler()["exe_link_cmd"    ]
         elif self.nodeType == "Dynamic Library" : cmd = self._getCompiler()["dynamic_link_cmd"]
-        elif self.nodeType == "Static Library"  : cmd = self._getCompiler()["static_link_cmd" ]
+        elif self.nodeType == "Static Library"  : cmd = self._getCompiler()[ self.getArchiveCmdName( "static_link_cmd" ) ]
         elif self.nodeType == "Swig Library"    : cmd = self._getCompiler()["dynamic_link_cmd"]
             
         # inherited libs and flags. Static libraries don't inherit from node they depends on
@@ -413,12 +587,16 @@ class _CppNode( noob.node.Node ) :
         auto_libs = cleanLibs[:]
         
         
+        # flags of the toolchain options, static libraries are built by the archiver
+        toolchainFlags = []
+        if self.nodeType != "Static Library" : toolchainFlags = self.getToolchainLdFlags( shlex.split( cmd )[0] )
+        
         # final flags
         allFlags  = self.ld_flags[:]  # be sure to copy, otherwise self.ld_flags will be modified
 #       allFlags += self.libs  
-        allFlags += auto_libs + auto_ldflags
-        allFlags  = list(set(allFlags))
-        objs = list( set( objs ) ) 
+        allFlags += toolchainFlags + auto_libs + auto_ldflags
+        allFlags  = uniqueList( allFlags )
+        objs      = uniqueList( objs )
         
         # check the command format correctness
         if not checkCmd( cmd , "$(IN)" , "$(OUT)" , "$(FLAGS)" ) : 
@@ -427,6 +605,7 @@ class _CppNode( noob.node.Node ) :
         # split the command string to convert it in a list of options
         # substitute all keywords in the command with the proper values
         cmd     = shlex.split(cmd)
+        if self.nodeType == "Static Library" : cmd[0] = self.getArchiver( cmd[0] )
         cmd_res = []
         for tok in cmd:
             if   "$(IN)"    in tok : cmd_res.extend( objs     ) 
@@ -434,9 +613,57 @@ class _CppNode( noob.node.Node ) :
             elif "$(FLAGS)" in tok : cmd_res.extend( allFlags ) 
             else                   : cmd_res.append( tok      )
         
-        return cmd_res , list( set( self.ld_flags + auto_ldflags ) ) , list( set( auto_libs ) )
+        return cmd_res , uniqueList( self.ld_flags + toolchainFlags + auto_ldflags ) , uniqueList( auto_libs )
         
     
+    def _warnToolchain( self , option , msg ) :
+        # warn once per node about an option that can't be applied
+        if option in self._toolchainWarnings : return
+        self._toolchainWarnings.add( option )
+        sys.stderr.write( "[WARNING] " + self.name() + " : " + msg + "\n" )
+    
+    
+    def _getOptionFlags( self , flagsName , option ) :
+        # flags flagsName of the compiler configuration, for the node option option
+        if flagsName in self._getCompiler() : return shlex.split( self._getCompiler()[flagsName] )
+        self._warnToolchain( option , "option '" + option + "' ignored with the compiler configuration '" + self._getCompiler()["config_name"] + "'" )
+        return []
+    
+    
+    def getToolchainCcFlags( self ) :
+        # compilation flags of the options split_dwarf and lto
+        flags = []
+        if self.split_dwarf : flags += self._getOptionFlags( "split_dwarf_flags" , "split_dwarf" )
+        if self.lto         : flags += self._getOptionFlags( "lto_flags"         , "lto"         )
+        return flags
+    
+    
+    def getToolchainLdFlags( self , linkExecutable ) :
+        
+        # link flags of the options linker and lto. The linker is only selected if 
+        # it can be run ( checked once per build process ), otherwise the default one is used
+        flags = []
+        if self.linker :
+            linkerFlags  = [ f.replace( "$(LINKER)" , self.linker ) for f in self._getOptionFlags( "linker_flags" , "linker" ) ]
+            checkCommand = [ linkExecutable ] + linkerFlags + shlex.split( self._getCompiler().get( "linker_check_flags" , "" ) )
+            if linkerFlags and not noob.compiler.isToolAvailable( checkCommand , getattr( self , "_environment" , None ) ) :
+                self._warnToolchain( "linker" , "linker '" + self.linker + "' not found, the default one is used" )
+                linkerFlags = []
+            flags += linkerFlags
+        if self.lto : flags += self._getOptionFlags( "lto_link_flags" , "lto" )
+        return flags
+    
+    
+    def getArchiver( self , archiver ) :
+        # archiver of the static libraries : the one of the compiler configuration 
+        # keeping the symbols of the LTO objects in the index, if lto is set and it is found
+        ltoArchiver = self._getCompiler().get( "lto_ar" )
+        if not self.lto or not ltoArchiver : return archiver
+        if noob.compiler.isToolAvailable( [ ltoArchiver , "--version" ] , getattr( self , "_environment" , None ) ) : return ltoArchiver
+        self._warnToolchain( "lto_ar" , "'" + ltoArchiver + "' not found, the index of the archive may miss the symbols of the LTO objects" )
+        return archiver
+    
+    
     def getCapturedEnvironment( self ) :
         
         # launch the initialisation script to capture the environment variables
@@ -447,8 +674,9 @@ class _CppNode( noob.node.Node ) :
             command = self._getCompiler()["init_script"]
             if sys.platform in ["darwin" , "linux" ] : command += ["&&" , "env" ]
             else                                     : command += ["&&" , "SET" ]
-            process = subprocess.Popen( command , shell = True , stdout = subprocess.PIPE , stderr = subprocess.PIPE ) 
-            ( stdout , stderr ) = process.communicate() 
+            with noob.jobserver.jobSlot() :
+                process = subprocess.Popen( command , shell = True , stdout = subprocess.PIPE , stderr = subprocess.PIPE ) 
+                ( stdout , stderr ) = process.communicate() 
             
             # parse stdout
             if stderr : 
@@ -473,9 +701,10 @@ class _CppNode( noob.node.Node ) :
     ##  Display formatting functions
     ## =============================
     def displayObjCommand( self , commandList , sourcePath , oFilePath , ccFlags , includes , progress ) :
+        eta = " ETA " + noob.buildhistory.formatDuration( self._remainingDuration / self._getParallelism() )
         if   self.obj_display_func != None  : self.obj_display_func( commandList , sourcePath , oFilePath , ccFlags , includes , progress )
-        elif self.display_mode == "normal"  : print( "[" + str(progress) + "%] " + " ".join(commandList) )
-        elif self.display_mode == "concise" : print( "[" + str(progress) + "%] " + oFilePath ) 
+        elif self.display_mode == "normal"  : print( "[" + str(progress) + "%" + eta + "] " + " ".join(commandList) )
+        elif self.display_mode == "concise" : print( "[" + str(progress) + "%" + eta + "] " + oFilePath ) 
     
     
     def displayLinkCommand( self , commandList , targetPath , ldFlags , libs ) :
@@ -484,6 +713,45 @@ class _CppNode( noob.node.Node ) :
         elif self.display_mode == "concise" : print( "Linking '" + targetPath + "'" ) 
         
         
+    ## =========================
+    ##  Scheduling
+    ## =========================
+    
+    def getLinkStamp( self , hash_method ) :
+        # value identifying the target of this node for the nodes linked against it
+        return hash_method( self.name() )
+    
+    def getIncrementalLinkCommands( self , objs , targetPath , dependentNodeList , cacheDict , newLinkCacheDict ) :
+        # commands updating the existing target instead of linking it again, or None
+        return None
+    
+    def getTargetCacheValues( self , objs , targetPath , dependentNodeList ) :
+        # values describing the target, recorded in the cache once it is built or restored
+        return {}
+    
+    def getNumThreads( self ) :
+        maxJobs = noob.jobserver.getJobServer().maxJobs
+        return maxJobs if self.num_thread == "auto" else self.num_thread
+    
+    def _getParallelism( self ) :
+        return max( 1 , min( self.getNumThreads() , noob.jobserver.getJobServer().maxJobs ) )
+    
+    def _estimateObjDurations( self , srcs = None ) :
+        # estimated compilation time of each source, from the previous builds.
+        # Sources never compiled get the longest known time, so they start first
+        history   = noob.buildhistory.getBuildHistory()
+        durations = { src : history.estimate( self.getAbsoluteObjectPath( src ) ) for src in ( srcs if srcs != None else self.srcs ) }
+        default   = max( [ d for d in durations.values() if d != None ] , default = 1. )
+        return { src : ( d if d != None else default ) for src,d in durations.items() }
+    
+    def estimateDuration( self , phaseName ) :
+        if phaseName == "compileObjects" : 
+            return sum( self._estimateObjDurations().values() ) / self._getParallelism()
+        if phaseName == "linkTarget" : 
+            return noob.buildhistory.getBuildHistory().estimate( self.targets()[0] , 1. )
+        return noob.node.Node.estimateDuration( self , phaseName )
+        
+        
     ## =========================
     ##  Compilation
     ## =========================
@@ -526,139 +794,401 @@ class _CppNode( noob.node.Node ) :
         return self
 
         
+    def _getCommandChanges( self , cachedArgsValue , args ) :
+        # format the options added and removed since the command cached
+        cachedArgs = set( noob.filetools.decodeCommand( cachedArgsValue ) )
+        addOpts    = set( args ).difference( cachedArgs )
+        subOpts    = cachedArgs .difference( set( args ) )
+        msg        = ""
+        if len( addOpts )!=0 : msg += "+['" + "','".join( sorted( addOpts ) ) + "']"
+        if len( subOpts )!=0 : msg += "-['" + "','".join( sorted( subOpts ) ) + "']" 
+        return msg
+        
+        
     def hasChanged( self , headerPath , cacheDict , writeCacheDictValue ) :
-        # calculer les md5 ici
-        with mtimeLock :
-            if headerPath not in mtimeLockDict.keys() :
-                mtimeLockDict[headerPath] = threading.Lock()
-                
-        with mtimeLockDict[headerPath] :
-            if headerPath in mtimeCache.keys() :
-                return mtimeCache[headerPath]
-            else :
+        # the mtime or md5 of each file is computed once per build, 
+        # whatever the number of sources including it
+        session = self.getSession()
+        key     = ( self.diff_method , self.hash_algorithm , headerPath )
+        with session.getLock( key ) :
+            isModified = session.fileStates.get( key )
+            if isModified == None :
                 objValue   = self.hash_method( headerPath ) 
                 isModified = cacheDict.get( headerPath , "" ) != objValue
                 
                 if isModified :
                     writeCacheDictValue[headerPath] = objValue
                 
-                mtimeCache[headerPath] = isModified
-                    
-                return isModified 
+                session.fileStates.set( key , isModified )
                 
+            return isModified 
                 
-    def hasDirectOrIndirectBeenModified( self , sourcePath , cacheDict , writeCacheDictValue ) : 
+                
+    def _findIncludes( self , filePath ) :
         
-        # returns True if this source file includes a direct or indirect header that  
-        # has been modified since the last compilation
+        # names of the files included with '#include "..."' directives in filePath.
+        # The file is only read again if it has changed since the last builds
+        session      = self.getSession()
+        incFileNames = session.includes.get( filePath )
+        if incFileNames == None :
+            incFileNames = noob.filetools.getBuildCache().getFileValue( "includes" , filePath , lambda p : "\n".join( scanIncludes( p ) ) )
+            incFileNames = incFileNames.split( "\n" ) if incFileNames else []
+            session.includes.set( filePath , incFileNames )
+        return incFileNames
         
-        # we have a dependency DAG where roots are file source ( .cpp ) and children
-        # are headers ( .h ) they depend on. The goal is to traverse all node of this
-        # DAG and process each of them their corresponding MD5 or MTime.
         
-        # we want to visit each nodes only once for performance reason and 
-        # avoid re-traversing sub-paths already visited. Therefore we're using a 
-        # global cache 'modifiedCache' that stores visited nodes, and their
-        # value corresponding to the result of the sub-path from this node.
+    def _resolveInclude( self , inc ) :
         
-        # to avoid race conditions, we have to use mutex on each node and on 
-        # the global cache variable. we can also avoid that by using coroutines
-        # but we didn't noticed a significant performance gain.
+        # search in the include directories specified by the user, then
+        # in the ones of the parent nodes of this node. If the file isn't
+        # found, it is not meant to be tracked ( system file for ex )
+        incDirs = self.incs[:]
+        for dependNode in self.parentNodeList :
+            if dependNode.nodeType in [ "Dynamic Library" , "Static Library" , "Swig Library" ]:
+                incDirs += dependNode.incs
         
-        with modifiedLock :
-            if sourcePath not in modifiedLockDict.keys() :
-                modifiedLockDict[sourcePath] = threading.Lock()
-            
-        with modifiedLockDict[sourcePath] :
-            if sourcePath in modifiedCache.keys():
-                return modifiedCache[sourcePath]
+        return self.getSession().includeIndex.resolve( incDirs , inc )
         
-            headerListModified = []
-            
-            includePattern = re.compile( r'^\s*#\s*include "(.+)"' )
-            
-            # parse sourcePath file to look for "#include" directives
+        
+    def getIncludedHeaders( self , sourcePath ) :
+        
+        # all the headers of this node and of its parents included directly
+        # or indirectly by sourcePath, sorted
+        headers   = set()
+        toVisit   = [ sourcePath ]
+        while toVisit :
+            for inc in self._findIncludes( toVisit.pop() ) :
+                headerPath = self._resolveInclude( inc )
+                if headerPath and headerPath not in headers :
+                    headers.add( headerPath )
+                    toVisit.append( headerPath )
+        
+        return sorted( headers )
+        
+        
+    def _getObjectCache( self ) :
+        if not self.obj_cache_dir and not self.obj_cache_url : return None
+        return noob.objcache.getObjectCache( self.obj_cache_dir , self.obj_cache_max_size , 
+                                             self.obj_cache_url , self.obj_cache_read_only , self.obj_cache_timeout )
+        
+        
+    def _getManifestKey( self , sourcePath , oFilePath , command , environment ) :
+        
+        # everything the object depends on, but its headers : the content of the source,
+        # the compilation command ( independent of where the object is written ), the 
+        # compiler itself and the precompiled header it includes. The headers given by
+        # the compiler for this key are recorded in its manifest ( see noob.objcache )
+        parts = [ self.getSession().getContentDigest( sourcePath ) ,
+                  [ self._toCachePath( c.replace( oFilePath , "$(OUT)" ) ) for c in command ] ,
+                  noob.compiler.getCompilerIdentity( command[0] , environment ) ]
+        if self._getPchStamp( sourcePath ) : parts.append( self._getPchStamp( sourcePath ) )
+        return noob.objcache.computeKey( *parts )
+        
+        
+    def _getObjectKey( self , manifestKey , headers ) :
+        # key of the object compiled with the given content of its headers
+        return noob.objcache.computeKey( manifestKey , [ self._toCachePath( h ) + ":" + self.getSession().getContentDigest( h ) for h in headers ] )
+        
+        
+    def _toCachePath( self , text ) :
+        # text written in the keys and the manifests of the object cache : the paths 
+        # under obj_cache_base_dir are relative to it, ex : "-I/home/me/project/inc" -> "-I./inc"
+        baseDir = self.obj_cache_base_dir.rstrip( "/\\" )
+        if not baseDir : return text
+        return re.sub( re.escape( baseDir ) + r'(?=[\\/]|$)' , "." , text )
+        
+        
+    def _fromCachePath( self , path ) :
+        # absolute path of a header read in a manifest
+        return os.path.normpath( os.path.join( self.obj_cache_base_dir , path ) )
+        
+        
+    def _getCompilerHeaders( self , headers ) :
+        # headers given by the compiler, as recorded in the build cache and in the manifests
+        return sorted( set( os.path.abspath( h ) for h in headers ) )
+        
+        
+    def _getLinkCacheKey( self , targetPath , linkCommand , environment ) :
+        
+        # the content of all the files given to the linker ( objects and libraries ), 
+        # the link command and the linker itself
+        inputs = [ c for c in linkCommand[1:] if c != targetPath and os.path.isfile( c ) ]
+        return noob.objcache.computeKey( 
+            [ self._toCachePath( c ) + ":" + self.getSession().getContentDigest( c ) for c in inputs ] ,
+            [ self._toCachePath( c.replace( targetPath , "$(OUT)" ) ) for c in linkCommand ] ,
+            noob.compiler.getCompilerIdentity( linkCommand[0] , environment ) )
+        
+        
+    def hasRecordedDependencyBeenModified( self , oFilePath , cacheDict , writeCacheDictValue , isVerbose ) :
+        
+        # returns True if one of the headers given by the compiler the last time 
+        # the object was compiled has been modified or deleted, or if the headers
+        # of this object are unknown. Headers are only checked with hash_method,
+        # their content is never parsed
+        depsValue = cacheDict.get( oFilePath + "_deps" , "" )
+        if not depsValue :
+            if isVerbose : print( oFilePath + " dependencies are unknown : eval" )
+            return True
+        
+        isModified = False
+        for headerPath in json.loads( depsValue ) :
+            if not os.path.exists( headerPath ) : 
+                isModified = True
+                continue
+            isModified = self.hasChanged( headerPath , cacheDict , writeCacheDictValue ) or isModified
             
-            # open and parse sourcePath file
-            with open( sourcePath ,'r' , encoding = "latin1" ) as sourceFile:   
-                
-                # search for #include directives
-                incFileNames = []
-                for line in sourceFile.readlines() :
-                    m = includePattern.findall(line)
-                    if len(m) ==1 :
-                        incFileNames += [ m[0] ]
+        return isModified
+        
+        
+    def recordDependencies( self , oFilePath , headers , cacheDict , writeCacheDictValue ) :
+        
+        # record the headers of an object, and their current value
+        headers = self._getCompilerHeaders( headers )
+        writeCacheDictValue[ oFilePath + "_deps" ] = json.dumps( headers )
+        for headerPath in headers :
+            if os.path.exists( headerPath ) : self.hasChanged( headerPath , cacheDict , writeCacheDictValue )
+        
+        
+    def hasDirectOrIndirectBeenModified( self , sourcePath , cacheDict , writeCacheDictValue ) : 
+        
+        # returns True if this source file includes a direct or indirect header that  
+        # has been modified since the last compilation
+        
+        # we have a dependency graph where roots are file source ( .cpp ) and children
+        # are headers ( .h ) they depend on. The goal is to traverse all the headers 
+        # reachable from this source and process their corresponding MD5 or MTime.
+        
+        # the traversal is iterative and doesn't hold any lock, so headers including 
+        # each other ( with include guards ) are visited once. The include directives,
+        # the location of the headers and their MD5 or MTime are cached in the session,
+        # so traversing the headers shared by many sources is cheap. Two threads may
+        # evaluate the same source at the same time : they compute the same answer.
+        session = self.getSession()
+        key     = ( self.diff_method , self.hash_algorithm , sourcePath )
+        isSourcePathToReeval = session.includesModified.get( key )
+        if isSourcePathToReeval != None : return isSourcePathToReeval
+        
+        isSourcePathToReeval = False
+        visitedPaths         = { sourcePath }
+        pathsToVisit         = [ sourcePath ]
+        while pathsToVisit :
             
             # for each '#include' found, locate the header in the filesystem
-            for inc in incFileNames :
-                
-                localHeaderFound = None
-                isDependent      = False
+            for inc in self._findIncludes( pathsToVisit.pop() ) :
                 
-                # search in the include directories specified by the user
-                for p in self.incs :
-                    testPath = os.path.join( p , inc )
-                    if os.path.exists( testPath ) :
-                        localHeaderFound = testPath
-                        break
+                # if the header isn't found, it is not meant to be tracked ( system file for ex )
+                localHeaderFound = self._resolveInclude( inc )
+                if not localHeaderFound or localHeaderFound in visitedPaths : continue
                 
-                
-                # look for headers included by parent nodes of this node
-                if not localHeaderFound:
-                    for dependNode in self.parentNodeList :
-                        if dependNode.nodeType in [ "Dynamic Library" , "Static Library" , "Swig Library" ]:
-                            for p in dependNode.incs:
-                                testPath = os.path.join(p,inc)
-                                if os.path.exists(testPath) :
-                                    localHeaderFound = testPath
-                                    isDependent = True
-                                    break
-                                    
-                                    
-#                 # test external libraries
-#                 if not localHeaderFound:
-#                     for externLib in self._externLibs :
-#                         for p in externLib["incs"]:
-#                             testPath = os.path.join(p,inc)
-#                             if os.path.exists(testPath) :
-#                                 localHeaderFound = testPath
-#                                 break
-                
-                # if the header was found , execute recursively if not already done for this path in the DAG
-                if localHeaderFound :
-                    
-                    localModified = self.hasChanged( localHeaderFound , cacheDict , writeCacheDictValue )
-                    
-                    # keep going traversing the DAG recursively
-                    # don't forget to put hasDirectOrIndirectBeenModified() in the lhs of the 'or' 
-                    # as it might no be evaluated if it were on the rhs of the 'or'
-                    localOrDependentModified = self.hasDirectOrIndirectBeenModified( localHeaderFound , cacheDict , writeCacheDictValue ) or localModified
-                    headerListModified.append( localOrDependentModified )
-                    
-                else:
-                    # this file is not meant to be tracked ( system file for ex )
-                    pass 
-            
-            isSourcePathToReeval = False
-            for m in headerListModified:
-                isSourcePathToReeval = isSourcePathToReeval or m
-                
-            modifiedCache[sourcePath] = isSourcePathToReeval
-                
-            return isSourcePathToReeval
+                # don't stop at the first modified header : all of them have to be 
+                # evaluated to record their new values in the cache
+                isSourcePathToReeval = self.hasChanged( localHeaderFound , cacheDict , writeCacheDictValue ) or isSourcePathToReeval
+                visitedPaths.add( localHeaderFound )
+                pathsToVisit.append( localHeaderFound )
+        
+        session.includesModified.set( key , isSourcePathToReeval )
+        return isSourcePathToReeval
             
             
     
-    def processObj( self , dependentNodeList , environment , sourcePath , cacheDict , progress ) : 
+    def isPchCompiledFromSource( self ) :
+        # msvc precompiles the headers included by a source, whose object has to be linked
+        return "pch_create_flags" in self._getCompiler()
+        
+        
+    def getPchPaths( self ) :
+        # ( file compiled to precompile pch , precompiled header , header included by the sources ),
+        # in tmp_dir. gcc compiles a header including pch, found next to it by "-include"
+        basePath = os.path.abspath( os.path.join( self.tmp_dir , "pch_" + hashlib.md5( self.name().encode( "utf-8" , "surrogateescape" ) ).hexdigest()[:16] ) )
+        suffix   = self._getCompiler().get( "pch_suffix" , ".pch" )
+        if self.isPchCompiledFromSource() : return ( basePath + ".cpp" , basePath + suffix , self.pch )
+        return ( basePath + ".h" , basePath + ".h" + suffix , basePath + ".h" )
+        
+        
+    def getPchFlags( self , sourcePath ) :
+        # flags of a C++ source to precompile pch, or to use the precompiled header
+        if not self.pch or "pch_use_flags" not in self._getCompiler() : return []
+        pchSource , pchPath , pchHeader = self.getPchPaths()
+        if sourcePath == pchSource : flags = self._getCompiler().get( "pch_create_flags" , "" )
+        else                       : flags = self._getCompiler()["pch_use_flags"]
+        return [ tok.replace( "$(PCH)" , pchHeader ).replace( "$(PCH_OUT)" , pchPath ) for tok in shlex.split( flags ) ]
+        
+        
+    def getDepMethod( self , sourcePath ) :
+        # the headers of the precompiled header are given by the compiler whenever it can :
+        # the scan only follows the '#include "..."' directives, and pch is mostly made 
+        # of '#include <...>' ones, from the include directories of the project or not
+        if self.pch and sourcePath == self.getPchPaths()[0] and self._getCompiler().get( "dep_flags" ) : return "depfile"
+        return self.dep_method
+        
+        
+    def getDepFlags( self , sourcePath ) :
+        # flags asking the compiler for the headers of a source. The ones of the precompiled 
+        # header include the system headers ( ex : -MD instead of -MMD ) : it is compiled once
+        # for all the sources, and they are often the headers it is made of
+        if self.pch and sourcePath == self.getPchPaths()[0] and "pch_dep_flags" in self._getCompiler() : 
+            return self._getCompiler()["pch_dep_flags"]
+        return self._getCompiler()["dep_flags"]
+        
+        
+    def _getPchStamp( self , sourcePath ) :
+        # stamp of the precompiled header used by a source, or "" if it uses none
+        if not self._pchStamp or sourcePath == self.getPchPaths()[0] or self.getObjCommandName( sourcePath ) != "c++_obj_cmd" : return ""
+        return self._pchStamp
+        
+        
+    def buildPch( self , dependentNodeList , environment , cacheDict ) :
+        
+        # precompile pch before the objects including it, as an object : it is compiled again
+        # when the file including pch, its headers or the C++ flags change. Returns the object 
+        # to link ( msvc ) or None and whether it has changed, or self if an error occured
+        self._pchStamp = ""
+        if "pch_use_flags" not in self._getCompiler() :
+            self._warnToolchain( "pch" , "option 'pch' ignored with the compiler configuration '" + self._getCompiler()["config_name"] + "'" )
+            return None , False
+        if not os.path.exists( self.pch ) :
+            return self._onError( "Missing file " + self.pch )
+        
+        # the file including pch is only written if its content has changed
+        pchSource , pchPath , pchHeader = self.getPchPaths()
+        content = '#include "' + self.pch.replace( "\\" , "/" ) + '"\n'
+        try :
+            with open( pchSource , "r" , encoding = "utf-8" , errors = "surrogateescape" ) as pchFile :
+                isUpToDate = pchFile.read() == content
+        except ( OSError , UnicodeError ) :
+            isUpToDate = False
+        try :
+            if not isUpToDate :
+                with open( pchSource , "w" , encoding = "utf-8" , errors = "surrogateescape" ) as pchFile :
+                    pchFile.write( content )
+        except OSError as e :
+            return self._onError( "Cannot write " + pchSource + " : " + str(e) )
+        
+        result = self.prepareObj( dependentNodeList , environment , pchSource , cacheDict , 0 )
+        if result is self : return self
+        oFilePath , isChanged , writeCacheDictValue , compileJob = result
+        if compileJob != None :
+            try :
+                processResult = noob.engine.getEngine().run( compileJob["command"] , environment , group = self ,
+                                                             memory = noob.buildhistory.getBuildHistory().estimatePeakMemory( oFilePath , 0 ) )
+            except concurrent.futures.CancelledError :
+                for path in [ compileJob["tmpObjPath"] , compileJob["depFilePath"] ] :
+                    if os.path.exists( path ) : os.remove( path )
+                return self._onError( "Compilation cancelled" )
+            result = self.finishObj( oFilePath , isChanged , writeCacheDictValue , compileJob , processResult )
+            if result is self : return self
+            oFilePath , isChanged , writeCacheDictValue = result
+        
+        if len(writeCacheDictValue) > 0 :
+            cacheDict.update( writeCacheDictValue )
+            noob.filetools.updateCacheDict( writeCacheDictValue )
+        
+        # the objects are compiled again when the content of pch or of its headers, 
+        # or the command precompiling it have changed, whatever the diff method. The
+        # headers are the ones given by the compiler, if it gives them
+        command   = [ c.strip() for c in self.getObjCommand( pchSource , oFilePath , dependentNodeList )[0] ]
+        depsValue = cacheDict.get( oFilePath + "_deps" , "" ) if self.getDepMethod( pchSource ) == "depfile" else ""
+        try :
+            headers        = json.loads( depsValue ) if depsValue else self.getIncludedHeaders( pchSource )
+            self._pchStamp = self._getObjectKey( self._getManifestKey( pchSource , oFilePath , command , environment ) , headers )
+        except OSError as e :
+            return self._onError( "Cannot read the headers of " + self.pch + " : " + str(e) )
+        
+        return ( oFilePath if self.isPchCompiledFromSource() else None ) , isChanged
+        
+        
+    def getUnityBatches( self ) :
+        
+        # the sources grouped in unity files of about unity_batch_size sources, as a list of 
+        # ( unity file path , sources ). The sources are sorted, and a batch of at least half 
+        # unity_batch_size sources ends with a source whose name hash is a multiple of 
+        # unity_batch_size ( or at twice this size ) : adding or removing a source only 
+        # changes its own batch, or the next one. A batch is named after its last source.
+        # C and C++ sources are in separate batches, compiled by their own command
+        batches = []
+        if self.unity_batch_size <= 1 : return batches
+        
+        groups = {}
+        for src in sorted( self.srcs ) :
+            groups.setdefault( self.getObjCommandName( src ) , [] ).append( src )
+        
+        for cmdName , srcs in sorted( groups.items() ) :
+            extension = ".cpp" if cmdName == "c++_obj_cmd" else ".c"
+            batch     = []
+            for src in srcs :
+                batch.append( src )
+                nameHash = int( hashlib.md5( os.path.basename( src ).encode( "utf-8" , "surrogateescape" ) ).hexdigest() , 16 )
+                isBoundary = nameHash % self.unity_batch_size == 0 and len( batch ) >= self.unity_batch_size // 2
+                if isBoundary or len( batch ) >= 2 * self.unity_batch_size or src == srcs[-1] :
+                    unityName = "unity_" + hashlib.md5( ( self.name() + "\0" + src ).encode( "utf-8" , "surrogateescape" ) ).hexdigest()[:16] + extension
+                    batches.append( ( os.path.abspath( os.path.join( self.tmp_dir , unityName ) ) , batch ) )
+                    batch = []
+        return batches
+        
+        
+    def getCompilationUnits( self , cacheDict ) :
+        
+        # the files to compile, in the order of the sources : the sources themselves, 
+        # or with unity_batch_size the unity files, written if their content has changed.
+        # A source edited since the previous build becomes hot : it is compiled alone, 
+        # so editing it again only compiles it. Beyond unity_batch_size hot sources, 
+        # the least recently edited ones go back to their batch
+        if self.unity_batch_size <= 1 : return self.srcs[:]
+        
+        hotKey    = self.name() + "_unity_hot"
+        hotSrcs   = [ src for src in noob.filetools.decodeCommand( cacheDict.get( hotKey , "" ) ) if src in self.srcs ]
+        newValues = {}
+        for src in self.srcs :
+            stampKey = self.name() + src + "_unity_stamp"
+            stamp    = self.hash_method( src )
+            previous = cacheDict.get( stampKey , "" )
+            if previous == stamp : continue
+            newValues[ stampKey ] = stamp
+            if previous : hotSrcs = [ s for s in hotSrcs if s != src ] + [ src ]
+        hotSrcs = hotSrcs[ -self.unity_batch_size : ]
+        
+        if noob.filetools.encodeCommand( hotSrcs ) != cacheDict.get( hotKey , "" ) :
+            newValues[ hotKey ] = noob.filetools.encodeCommand( hotSrcs )
+        if newValues :
+            cacheDict.update( newValues )
+            noob.filetools.updateCacheDict( newValues )
+        
+        # the sources of a batch are included with absolute paths : the headers
+        # next to them are found, and they are tracked as headers of the unity file
+        srcIndices = { src : i for i , src in enumerate( self.srcs ) }
+        units      = [ ( srcIndices[ src ] , src ) for src in hotSrcs ]
+        for unityPath , batch in self.getUnityBatches() :
+            batch = [ src for src in batch if src not in hotSrcs ]
+            if len( batch ) <= 1 :
+                units += [ ( srcIndices[ src ] , src ) for src in batch ]
+                continue
+            
+            content  = "// unity build of " + self.name() + ", generated by noob\n"
+            content += "".join( '#include "' + src.replace( "\\" , "/" ) + '"\n' for src in sorted( batch , key = srcIndices.get ) )
+            try :
+                with open( unityPath , "r" , encoding = "utf-8" , errors = "surrogateescape" ) as unityFile :
+                    isUpToDate = unityFile.read() == content
+            except ( OSError , UnicodeError ) :
+                isUpToDate = False
+            if not isUpToDate :
+                with open( unityPath , "w" , encoding = "utf-8" , errors = "surrogateescape" ) as unityFile :
+                    unityFile.write( content )
+            units.append( ( min( srcIndices[ src ] for src in batch ) , unityPath ) )
         
-        if self.cancelAll : return "" , False , {}
+        return [ unit for _ , unit in sorted( units ) ]
+        
+        
+    def prepareObj( self , dependentNodeList , environment , sourcePath , cacheDict , progress ) : 
+        
+        # check if the object has to be compiled. Returns the object path, if it
+        # has to be compiled, the values to cache, and the compilation job to 
+        # give to the engine then to finishObj() ( None if nothing has to be run )
+        if self.cancelAll : return "" , False , {} , None
         
         force_reeval = False
         
         # generate the absolute path and the name of the object
-        oFilePath = self.getObjectPath( sourcePath )
-        if not os.path.isabs( oFilePath ):
-            oFilePath = os.path.realpath( os.path.join( os.getcwd() , oFilePath ) ) 
+        oFilePath = self.getAbsoluteObjectPath( sourcePath )
         
         # generate the object compilation command in a list 
         # ex : [ '-c' , '-pipe' , '-g' , '-gdwarf-2' , '-arch x86_64' , '-w' , '-fPIC' ,'-o' , 'build/hello.o src/hello.cc' ]
@@ -694,103 +1224,248 @@ class _CppNode( noob.node.Node ) :
             force_reeval = True
         
         # check if the object command has been modified ( without include paths ) 
-        cmdKey            = oFilePath + "_cmd" # sourcePath + 
-        cmdCachedValueStr = cacheDict.get( cmdKey  , "" )
-        cmdCachedValue    = set( s.strip() for s in cmdCachedValueStr[1:-1].split(",") )
-        cmdValue          = set( v.strip() for v in command if not v.startswith( ( "-I" , "-iquote" , "-isystem" ) ) ) #v[0:2] not in [ "-I" , "-iquote" , "-isystem" ]  ) 
-        if cmdCachedValue != cmdValue :
-            addOpts = cmdValue      .difference( cmdCachedValue )
-            subOpts = cmdCachedValue.difference( cmdValue       )
-            msg     = ""
-            if len( addOpts )!=0 : msg += "+['" + "','".join(addOpts) + "]"
-            if len( subOpts )!=0 : msg += "-['" + "','".join(subOpts) + "]" 
-                
-            if not force_reeval : print( sourcePath + " command has changed " + msg + ": reeval" )
+        cmdKey   = oFilePath + "_cmd" # sourcePath + 
+        cmdArgs  = [ v.strip() for v in command if not v.startswith( ( "-I" , "-iquote" , "-isystem" ) ) ] #v[0:2] not in [ "-I" , "-iquote" , "-isystem" ]  ) 
+        cmdValue = noob.filetools.hashCommand( cmdArgs )
+        if cacheDict.get( cmdKey , "" ) != cmdValue :
+            if not force_reeval : 
+                msg = self._getCommandChanges( cacheDict.get( cmdKey + "_args" , "" ) , cmdArgs )
+                print( sourcePath + " command has changed " + msg + ": reeval" )
             
-            # record the full command string as value to be able to display 
+            # record the full command as well to be able to display 
             # the changes to the user later if needed ( as above )
-            writeCacheDictValue[cmdKey] = "[" + ",".join(cmdValue)  + "]"
+            writeCacheDictValue[cmdKey          ] = cmdValue
+            writeCacheDictValue[cmdKey + "_args"] = noob.filetools.encodeCommand( cmdArgs )
             force_reeval = True
          
         
         # check if an include path has been deleted or modified
         # TODO : check if the modified include path has an impact on this obj
         # ie if this obj includes those include paths
-        incsKey            = sourcePath + "_incs_paths"
-        incsValue          = set( v.strip() for v in command if v.startswith( ("-I" , "-iquote" , "-isystem" ) ) )
-        incsCachedValueStr = cacheDict.get( incsKey  , "" )
-        incsCachedValue    = set( s.strip() for s in incsCachedValueStr[1:-1].split(",") )
-        if incsCachedValueStr[1:-1].split(",") == [''] : incsCachedValue = set()
-        if incsCachedValue != incsValue :
+        incsKey   = sourcePath + "_incs_paths"
+        incsArgs  = [ v.strip() for v in command if v.startswith( ("-I" , "-iquote" , "-isystem" ) ) ]
+        incsValue = noob.filetools.hashCommand( incsArgs )
+        if cacheDict.get( incsKey , "" ) != incsValue :
             if not force_reeval : 
                 print( sourcePath + " has one include path that has been deleted or modified : reeval" ) 
-                addOpts = incsValue      .difference( incsCachedValue )
-                subOpts = incsCachedValue.difference( incsValue       )
-                msg  = ""
-                if len( addOpts )!=0 : msg += "+['" + "','".join(addOpts) + "]"
-                if len( subOpts )!=0 : msg += "-['" + "','".join(subOpts) + "]" 
-                print( msg )
+                print( self._getCommandChanges( cacheDict.get( incsKey + "_args" , "" ) , incsArgs ) )
             
-            # record the full command string as value to be able to display 
+            # record the full include paths as well to be able to display 
             # the changes to the user later if needed ( as above )
-            writeCacheDictValue[incsKey] = "[" + ",".join(incsValue) + "]"
+            writeCacheDictValue[incsKey          ] = incsValue
+            writeCacheDictValue[incsKey + "_args"] = noob.filetools.encodeCommand( incsArgs )
             force_reeval = True
         
-        # check 
-        if self.hasDirectOrIndirectBeenModified( sourcePath , cacheDict , writeCacheDictValue ) : 
-            force_reeval = True
-            
         # check if a dependent header file has been modified
+        depMethod = self.getDepMethod( sourcePath )
+        if depMethod == "depfile" :
+            if self.hasRecordedDependencyBeenModified( oFilePath , cacheDict , writeCacheDictValue , not force_reeval ) :
+                force_reeval = True
+        elif self.hasDirectOrIndirectBeenModified( sourcePath , cacheDict , writeCacheDictValue ) : 
+            force_reeval = True
+        
+        # check if the precompiled header included by this object has changed
+        pchStamp = self._getPchStamp( sourcePath )
+        if pchStamp :
+            pchKey = oFilePath + "_pch"
+            if cacheDict.get( pchKey , "" ) != pchStamp :
+                if not force_reeval : print( sourcePath + " precompiled header has changed : reeval" )
+                writeCacheDictValue[ pchKey ] = pchStamp
+                force_reeval = True
                 
         # regenerate the object if needed
         if force_reeval :
             
-            # delete all the targets beforehand, so if the compilation 
-            # thread is killed, the object will be regenerated next time
+            # look for an identical object in the shared object cache first, with each
+            # list of headers given by the compiler for this source and this command. 
+            # Not with split_dwarf : the .dwo file of the object isn't stored with it,
+            # nor for the precompiled header : it is large, and not an object with msvc.
+            # The headers have to be given by the compiler
+            isPch       = self.pch and sourcePath == self.getPchPaths()[0]
+            objectCache = self._getObjectCache() if not self.split_dwarf and not isPch else None
+            if objectCache and not self._getCompiler().get( "dep_flags" ) :
+                self._warnToolchain( "obj_cache_dir" , "object cache disabled with the compiler configuration '" + self._getCompiler()["config_name"] + "' : no 'dep_flags' to list the headers" )
+                objectCache = None
+            manifestKey   = None
+            cachedHeaders = None
+            if objectCache :
+                try :
+                    manifestKey = self._getManifestKey( sourcePath , oFilePath , command , environment )
+                    for headers in objectCache.getManifest( manifestKey ) :
+                        headers = [ self._fromCachePath( h ) for h in headers ]
+                        if not all( os.path.exists( h ) for h in headers ) : continue
+                        if objectCache.get( self._getObjectKey( manifestKey , headers ) , oFilePath ) :
+                            cachedHeaders = headers
+                            break
+                except OSError as e :
+                    sys.stderr.write( "[WARNING] object cache disabled for " + sourcePath + " : " + str(e) + "\n" )
+                    manifestKey = None
+            
+            if cachedHeaders != None :
+                print( oFilePath + " restored from the object cache" )
+                
+                # the compiler didn't run : record the headers it gave for the cached object instead
+                if depMethod == "depfile" :
+                    self.recordDependencies( oFilePath , cachedHeaders , cacheDict , writeCacheDictValue )
+                return oFilePath , force_reeval , writeCacheDictValue , None
+            
+            # compile in a temporary file : the previous object is only replaced 
+            # if the new one is different ( see finishObj ), and it is never 
+            # left half-written if the build is killed
+            tmpObjPath = oFilePath + ".tmp"
             try :
-                if os.path.exists( oFilePath ) : os.remove( oFilePath )
+                if os.path.exists( tmpObjPath ) : os.remove( tmpObjPath )
             except Exception as e:
-                return self._onError( "Deletion Error of " + oFilePath +" : Cause " + str(e)  )
+                return self._onError( "Deletion Error of " + tmpObjPath +" : Cause " + str(e)  )
      
             # print the command on stdout
             self.displayObjCommand( command , sourcePath , oFilePath , ccFlags , includes , progress )
             
-            # launch the compilation sub-process 
-            process = subprocess.Popen( command , stdout = subprocess.PIPE , stderr = subprocess.PIPE , env = environment ) # , stdout=subprocess.PIPE, stderr=subprocess.STDOUT )
-            ( stdout , stderr ) = process.communicate() 
+            # ask the compiler for the list of the headers, out of the command recorded in the cache
+            compileCommand = [ c.strip() for c in self.getObjCommand( sourcePath , tmpObjPath , dependentNodeList )[0] ]
+            depFilePath    = oFilePath + ".d"
+            listHeaders    = depMethod == "depfile" or manifestKey != None
+            depFlags       = self.getDepFlags( sourcePath ) if listHeaders else ""
+            if listHeaders :
+                compileCommand = compileCommand + [ tok.replace( "$(DEP)" , depFilePath ) for tok in shlex.split( depFlags ) ]
+            
+            # very long commands are given to the compiler in a response file
+            try :
+                compileCommand = self.getResponseFileCommand( compileCommand , oFilePath + ".rsp" )
+            except OSError as e :
+                return self._onError( "Cannot write the response file of " + oFilePath + " : " + str(e) )
             
-            if stdout : print( stdout.decode( sys.getdefaultencoding() ) )
-             
-            # check if errors were generated
-            if process.returncode != 0 :
-                sys.stderr.write( str(stderr.decode()) ) 
-                sys.stderr.flush()
-                if os.path.exists( oFilePath ) : os.remove( oFilePath )
-                return self._onError( "Compilation Error for " + oFilePath + " return Code " + str(process.returncode) )
+            compileJob = {
+                "command"        : compileCommand ,
+                "tmpObjPath"     : tmpObjPath     ,
+                "depFilePath"    : depFilePath    ,
+                "depMethod"      : depMethod      ,
+                "listHeaders"    : listHeaders    ,
+                "depFlags"       : depFlags       ,
+                "cacheDict"      : cacheDict      ,
+                "objectCache"    : objectCache    ,
+                "manifestKey"    : manifestKey
+            }
+            return oFilePath , force_reeval , writeCacheDictValue , compileJob
             
         # check if this object exists actually
         if not os.path.exists( oFilePath ) : 
             return self._onError( "Error " + oFilePath + " doesn't exist" )
         
-        return oFilePath , force_reeval , writeCacheDictValue
+        return oFilePath , force_reeval , writeCacheDictValue , None
+        
+        
+    def finishObj( self , oFilePath , force_reeval , writeCacheDictValue , compileJob , result ) :
+        
+        # process the result of the compilation of an object prepared by prepareObj().
+        # Returns the object path, whether its content has changed, and the values to cache
+        depFilePath = compileJob["depFilePath"]
+        tmpObjPath  = compileJob["tmpObjPath" ]
+        depMethod   = compileJob["depMethod"  ]
+        listHeaders = compileJob["listHeaders"]
+        depFlags    = compileJob["depFlags"   ]
+        
+        stdout = result.stdout.decode( sys.getdefaultencoding() , "replace" )
+        if listHeaders and "$(DEP)" not in depFlags :
+            headers , stdout = parseShowIncludes( stdout )
+        if stdout.strip() : print( stdout )
+         
+        # check if errors were generated
+        if result.returncode != 0 :
+            sys.stderr.write( str(result.stderr.decode()) ) 
+            sys.stderr.flush()
+            if os.path.exists( tmpObjPath  ) : os.remove( tmpObjPath  )
+            if os.path.exists( depFilePath ) : os.remove( depFilePath )
+            return self._onError( "Compilation Error for " + oFilePath + " return Code " + str(result.returncode) )
+        
+        noob.buildhistory.getBuildHistory().record( oFilePath , result.duration )
+        if result.peakMemory : noob.buildhistory.getBuildHistory().recordPeakMemory( oFilePath , result.peakMemory )
+        
+        # record the exact list of headers used by this object 
+        if listHeaders and "$(DEP)" in depFlags :
+            try :
+                with open( depFilePath , "r" , encoding = "utf-8" , errors = "surrogateescape" ) as depFile :
+                    headers = parseMakeDependencies( depFile.read() )[1:] # the first one is the source itself
+                os.remove( depFilePath )
+            except OSError as e :
+                return self._onError( "Cannot read the dependencies of " + oFilePath + " : " + str(e) )
+        if depMethod == "depfile" :
+            self.recordDependencies( oFilePath , headers , compileJob["cacheDict"] , writeCacheDictValue )
+        
+        # check if this object exists actually
+        if not os.path.exists( tmpObjPath ) : 
+            return self._onError( "Error " + tmpObjPath + " doesn't exist" )
+        
+        # early cutoff : an object identical to the previous one is kept with its 
+        # modification time, so the link doesn't see it as modified
+        try :
+            isObjChanged = not os.path.exists( oFilePath ) or not filecmp.cmp( tmpObjPath , oFilePath , shallow = False )
+            if isObjChanged : os.replace( tmpObjPath , oFilePath )
+            else            : os.remove ( tmpObjPath )
+        except OSError as e :
+            return self._onError( "Cannot replace " + oFilePath + " : " + str(e) )
+        if not isObjChanged : print( oFilePath + " is unchanged" )
+        
+        # store the object with the headers given by the compiler
+        if compileJob["manifestKey"] :
+            headers = self._getCompilerHeaders( headers )
+            try :
+                compileJob["objectCache"].put( self._getObjectKey( compileJob["manifestKey"] , headers ) , oFilePath )
+                compileJob["objectCache"].addToManifest( compileJob["manifestKey"] , [ self._toCachePath( h ) for h in headers ] )
+            except OSError as e :
+                sys.stderr.write( "[WARNING] object cache : cannot store " + oFilePath + " : " + str(e) + "\n" )
+        
+        return oFilePath , isObjChanged , writeCacheDictValue
+        
+        
+    def phases( self ) :
+        # the objects only depend on headers, not on the parent libraries : 
+        # they can be compiled while the parent nodes are still being built.
+        # Only the link has to wait for the targets of the parent nodes
+        return [ ( "compileObjects" , False ) , ( "linkTarget" , True ) ]
         
         
     def evaluate( self , **kwargs ) :
+        if "Error" not in self.compileObjects( **kwargs ).status :
+            self.linkTarget( **kwargs )
+        return self
+        
+        
+    def compileObjects( self , **kwargs ) :
+        
+        self.status    = "Compiling"
+        self.cancelAll = False
+        noob.engine.getEngine().reset( self )
+        
+        # the flags of this node and of its parents may have changed since the last build
+        self._objCommandTemplates = {}
         
         # set the compiler if needed
         if "compiler" in kwargs.keys() and kwargs["compiler"] == None :
             self._compiler = kwargs["compiler"]
             
         # record the starting time
-        startTime = datetime.datetime.now()
+        startTime       = datetime.datetime.now()
+        self._startTime = startTime
         
         # select the the correct comparison method
         if self.diff_method == "mtime" : 
             self.hash_method = lambda filePath : str(os.stat( filePath ).st_mtime)
         elif self.diff_method == "md5" : 
-            self.hash_method = lambda filePath : hashlib.md5( open( filePath , 'rb' ).read() ).hexdigest()
+            self.hash_method = lambda filePath : noob.filetools.hashFile( filePath , self.hash_algorithm )
+        elif self.diff_method == "hybrid" : 
+            self.hash_method = lambda filePath : noob.filetools.hashFileHybrid( filePath , self.hash_algorithm )
         else:
             return self._onError( "Unknown diff method : " + self.diff_method ) 
+        
+        if self.hash_algorithm not in hashlib.algorithms_available :
+            return self._onError( "Unknown hash algorithm : " + self.hash_algorithm ) 
+        
+        # check the method to find the headers
+        if self.dep_method not in [ "scan" , "depfile" ] :
+            return self._onError( "Unknown dependency method : " + self.dep_method ) 
+        if self.dep_method == "depfile" and not self._getCompiler().get( "dep_flags" ) :
+            return self._onError( "The compiler configuration has no 'dep_flags' to use the 'depfile' dependency method" ) 
             
         # check if all sources exists 
         for src in self.srcs:
@@ -824,49 +1499,143 @@ class _CppNode( noob.node.Node ) :
             return self._onError( errMsg )
 
         # prefetch the noob cache
-        import noob
         cacheDict = noob.filetools.loadCacheDict()
         
+        # the sources to compile, or the unity files including them
+        try :
+            srcs = self.getCompilationUnits( cacheDict )
+        except OSError as e :
+            return self._onError( "Cannot write the unity files in " + self.tmp_dir + " : " + str(e) )
+        
         # process all sources with futures and ThreadPoolExecutor
         objs        = []
         forceRelink = False
         errMsg      = ""
-        
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.num_thread) as executor:
+        hasFailed   = False # an error already reported by self._onError()
+        
+        # the precompiled header is built before the objects including it
+        self._pchStamp = ""
+        if self.pch :
+            result = self.buildPch( dependentNodeList , environment , cacheDict )
+            if result is self : return self
+            pchObj , forceRelink = result
+            if pchObj : objs.append( pchObj )
+        
+        # submit the longest compilations first, so a long source 
+        # submitted last doesn't set the total time of the node
+        objDurations            = self._estimateObjDurations( srcs )
+        sortedSrcs              = sorted( srcs , key = lambda src : -objDurations[src] )
+        self._remainingDuration = sum( objDurations.values() )
+        
+        # each object goes through 3 steps : the threads check if it has to be 
+        # compiled ( prepareObj ), the engine runs the compiler while the threads
+        # prepare the next objects, then a thread processes its result ( finishObj )
+        engine = noob.engine.getEngine()
+        numThreads = self.getNumThreads()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=numThreads) as executor:
             future_to_src = {}
             
-            for sourceNumber,sourcePath in enumerate( self.srcs ) : 
-                progress = int( float(sourceNumber + 1) / float(len(self.srcs))  * 100 )
+            for sourceNumber,sourcePath in enumerate( sortedSrcs ) : 
+                progress = int( float(sourceNumber + 1) / float(len(srcs))  * 100 )
                 future_to_src[ 
-                    executor.submit( self.processObj , dependentNodeList , environment, sourcePath , cacheDict , progress )
-                ] = sourcePath
-                
+                    executor.submit( self.prepareObj , dependentNodeList , environment, sourcePath , cacheDict , progress )
+                ] = ( "prepare" , sourcePath , None )
                 
-            for future in concurrent.futures.as_completed(future_to_src):
-                src = future_to_src[future]
-                try:
-                    oFilePath , force_reeval , writeCacheDictValue = future.result()
-                    
-                    objs.append( oFilePath )
-                    if len(writeCacheDictValue) > 0 :
-                        cacheDict.update( writeCacheDictValue )
-                        noob.filetools.saveCacheDict( cacheDict ) 
-                    
-                    forceRelink = force_reeval or forceRelink
-                    
-                except Exception as e :
-                    
-                    errMsg += "Processing Error " + str(e) + " " + str(src) + "\n"
-                    
-                    if self.stop_on_error :
-                        self.cancelAll = True 
+            while future_to_src :
+                doneFutures , _ = concurrent.futures.wait( future_to_src , return_when = concurrent.futures.FIRST_COMPLETED )
+                for future in doneFutures :
+                    step , src , objResult = future_to_src.pop( future )
+                    try:
+                        result = future.result()
+                        if result is self : 
+                            # the error has been reported by self._onError() : the remaining
+                            # sources won't be compiled if the build stops on errors
+                            hasFailed = True
+                            if self.stop_on_error : self.cancel()
+                            with self._remainingDurationLock :
+                                self._remainingDuration -= objDurations[src]
+                            continue
+                        
+                        # launch the compiler, then process its result in a thread. The 
+                        # memory it needed last time lets the engine hold it back when 
+                        # the machine is short of memory. If the build has been cancelled,
+                        # the previous object is still there : its new values are not
+                        # cached, so it will be compiled by the next build
+                        if step == "prepare" and result[3] != None :
+                            if self.cancelAll : continue
+                            peakMemory    = noob.buildhistory.getBuildHistory().estimatePeakMemory( result[0] , 0 )
+                            compileFuture = engine.submit( result[3]["command"] , environment , limit = ( self , numThreads ) , group = self , memory = peakMemory )
+                            future_to_src[ compileFuture ] = ( "compile" , src , result )
+                            continue
+                        if step == "compile" :
+                            # stop the other compilations right away : finishObj() is
+                            # queued behind the sources still waiting to be prepared
+                            if result.returncode != 0 and self.stop_on_error : self.cancel()
+                            future_to_src[ executor.submit( self.finishObj , *objResult , result ) ] = ( "finish" , src , None )
+                            continue
+                        
+                        oFilePath , force_reeval , writeCacheDictValue = result[:3]
+                        if not oFilePath : continue # cancelled before being checked
+                        
+                        objs.append( oFilePath )
+                        if len(writeCacheDictValue) > 0 :
+                            cacheDict.update( writeCacheDictValue )
+                            noob.filetools.queueCacheDict( writeCacheDictValue ) 
+                        
+                        forceRelink = force_reeval or forceRelink
                         
-                    return errMsg , objs , forceRelink 
+                    except concurrent.futures.CancelledError :
+                        
+                        # the compiler has been killed : remove what it may have written. Its values 
+                        # are not cached, so the object will be compiled again by the next build
+                        compileJob = objResult[3]
+                        for path in [ compileJob["tmpObjPath"] , compileJob["depFilePath"] ] :
+                            if os.path.exists( path ) : os.remove( path )
+                        
+                    except Exception as e :
+                        
+                        errMsg += "Processing Error " + str(e) + " " + str(src) + "\n"
+                        
+                        # the remaining sources won't be compiled, and the 
+                        # compilers still running are stopped right away
+                        if self.stop_on_error :
+                            self.cancel()
+                    
+                    with self._remainingDurationLock :
+                        self._remainingDuration -= objDurations[src]
     
         
-        if errMsg : return self._onError( errMsg )
+        # write the values of the compiled objects still waiting in the batch
+        noob.filetools.flushCacheDict()
+        
+        if errMsg    : return self._onError( errMsg )
+        if hasFailed : return self
+        if self.cancelAll : return self._onError( "Compilation cancelled" )
         
+        # link the objects in the order of the sources, not in the order 
+        # the compilations ended, so the link command is the same each time
+        srcIndices = { self.getAbsoluteObjectPath( src ) : i for i , src in enumerate( srcs ) }
+        objs.sort( key = lambda oFilePath : srcIndices.get( oFilePath , len( srcIndices ) ) )
         
+        # keep what the link phase needs
+        self._environment       = environment
+        self._dependentNodeList = dependentNodeList
+        self._cacheDict         = cacheDict
+        self._objs              = objs
+        self._forceRelink       = forceRelink
+        
+        self.status = "Compiled"
+        return self
+        
+        
+    def linkTarget( self , **kwargs ) :
+        
+        startTime         = self._startTime
+        environment       = self._environment
+        dependentNodeList = self._dependentNodeList
+        cacheDict         = self._cacheDict
+        objs              = self._objs
+        forceRelink       = self._forceRelink
         
         # all objects ready to be linked have been compiled from here
         # if at least one object has been recompiled, then forceRelink is True
@@ -892,23 +1661,30 @@ class _CppNode( noob.node.Node ) :
         linkCommand , ldFlags , libs = self.getLinkCommand( objs , targetPath , dependentNodeList )
         linkCommand = [ c.strip() for c in linkCommand ] # remove harmful spaces
         
-        linkCmdKey            = self.name() + "_link_cmd"
-        linkCmdCachedValueStr = cacheDict.get( linkCmdKey  , "" )
-        linkCmdCachedValue    = set( s.strip() for s in linkCmdCachedValueStr[1:-1].split(",") )
-        linkCmdValue          = set( v.strip() for v in linkCommand ) 
-        if linkCmdCachedValue != linkCmdValue :
-            addOpts = linkCmdValue      .difference( linkCmdCachedValue )
-            subOpts = linkCmdCachedValue.difference( linkCmdValue       )
-            msg     = ""
-            if len( addOpts )!=0 : msg += "+['" + "','".join(addOpts) + "]"
-            if len( subOpts )!=0 : msg += "-['" + "','".join(subOpts) + "]" 
-            
-            if not forceRelink : print( "Link command has changed " + msg + ": reeval" )
+        linkCmdKey   = self.name() + "_link_cmd"
+        linkCmdValue = noob.filetools.hashCommand( linkCommand )
+        if cacheDict.get( linkCmdKey , "" ) != linkCmdValue :
+            if not forceRelink : 
+                msg = self._getCommandChanges( cacheDict.get( linkCmdKey + "_args" , "" ) , linkCommand )
+                print( "Link command has changed " + msg + ": reeval" )
             
-            # record the full command string as value to be able to display 
+            # record the full command as well to be able to display 
             # the changes to the user later if needed ( as above )
-            newLinkCacheDict[ linkCmdKey ] = "[" + ",".join(linkCmdValue)  + "]" 
+            newLinkCacheDict[ linkCmdKey           ] = linkCmdValue
+            newLinkCacheDict[ linkCmdKey + "_args" ] = noob.filetools.encodeCommand( linkCommand )
             forceRelink = True
+        
+        # check if an object has been modified since the last link : an object
+        # recompiled identical to the previous one has kept its modification time,
+        # and an object compiled by a build that failed before the link is seen as modified
+        for oFilePath in objs :
+            objKey         = self.name() + oFilePath
+            objValue       = self.hash_method( oFilePath )
+            objCachedValue = cacheDict.get( objKey , "" )
+            if objCachedValue != objValue :
+                if not forceRelink and objCachedValue : print( oFilePath + " has been modified : relinking ..." )
+                forceRelink = True
+                newLinkCacheDict[objKey] = objValue
             
         
         # check if a dependent library node has been modified
@@ -919,14 +1695,15 @@ class _CppNode( noob.node.Node ) :
         if self.nodeType in [ "Dynamic Library" , "Executable" ] :
             
             # retreive the list of dependent nodes that are dynamic or static libraries
-            dependLibPaths = [ n.name() for n in dependentNodeList if n.nodeType in [ "Dynamic Library" , "Static Library" ] ]
-            dependLibPaths = list( set( dependLibPaths ) )
+            dependLibNodes = [ n for n in dependentNodeList if n.nodeType in [ "Dynamic Library" , "Static Library" ] ]
             
             # this node is an executable or a dynamic library, it is
-            # mandatory to relink against the modified dependent libraries
-            for libFilePath in dependLibPaths :
+            # mandatory to relink against the modified dependent libraries.
+            # Only the interface of the dynamic libraries with 'abi_check' matters
+            for libNode in dependLibNodes :
+                libFilePath    = libNode.name()
                 objKey         = self.name() + libFilePath
-                objValue       = self.hash_method( libFilePath ) 
+                objValue       = libNode.getLinkStamp( self.hash_method )
                 objCachedValue = cacheDict.get( objKey , "" )
                 if  objCachedValue!= objValue :
                     print( libFilePath + " has been modified : relinking ..." )
@@ -939,33 +1716,74 @@ class _CppNode( noob.node.Node ) :
         # and this node is up-to-date
         if not forceRelink : return self._onUpToDate( startTime ) 
         
-        # remove the target beforhand so if the compilation thread is killed 
+        # look for an identical target in the shared object cache first. A thin 
+        # archive only holds references to the objects of this build, and a target 
+        # with split_dwarf to their .dwo files : they aren't shared
+        objectCache  = self._getObjectCache()
+        linkCacheKey = None
+        if objectCache and not getattr( self , "thin_archive" , False ) and not self.split_dwarf :
+            try :
+                linkCacheKey = self._getLinkCacheKey( targetPath , linkCommand , environment )
+            except OSError as e :
+                sys.stderr.write( "[WARNING] object cache disabled for " + targetPath + " : " + str(e) + "\n" )
+        
+        if linkCacheKey and objectCache.get( linkCacheKey , targetPath , isExecutable = self.nodeType != "Static Library" ) :
+            print( targetPath + " restored from the object cache" )
+            newLinkCacheDict.update( self.getTargetCacheValues( objs , targetPath , dependentNodeList ) )
+            if len(newLinkCacheDict) > 0 :
+                cacheDict.update( newLinkCacheDict )
+                noob.filetools.updateCacheDict( newLinkCacheDict ) 
+            return self._onBuilt( startTime )
+        
+        # update the target in place if possible ( static libraries ), 
+        # otherwise remove it beforhand so if the compilation thread is killed 
         # here, the target will nevertheless be recompiled next time
-        try :
-            if os.path.exists( targetPath ) : os.remove( targetPath )
-        except Exception as e:
-            return self._onError( "Deletion Error of " + targetPath +" : Cause " + str(e) )
-        
-        # launch the linking sub-process 
-        self.displayLinkCommand( linkCommand , targetPath , ldFlags , libs )
-        process = subprocess.Popen( linkCommand , stderr = subprocess.PIPE , env = environment ) # , stdout=subprocess.PIPE, stderr=subprocess.STDOUT )
-        ( stdout , stderr ) = process.communicate()
-        if stdout : print( stdout.decode( sys.getdefaultencoding() ) )
+        linkCommands = self.getIncrementalLinkCommands( objs , targetPath , dependentNodeList , cacheDict , newLinkCacheDict )
+        isIncremental = linkCommands != None
+        if not isIncremental :
+            linkCommands = [ linkCommand ]
+            try :
+                if os.path.exists( targetPath ) : os.remove( targetPath )
+            except Exception as e:
+                return self._onError( "Deletion Error of " + targetPath +" : Cause " + str(e) )
         
-        # check if errors where generated during the link process
-        if len(stderr) != 0:
-            sys.stderr.write( stderr.decode( sys.getdefaultencoding() ) )
-            # if os.path.exists( targetPath ) : os.remove( targetPath )
-            return self._onError( "Link Error for " + targetPath + " return Code " + str(process.returncode) )
+        # launch the linking sub-processes, with a response file if a command is very long
+        duration = 0.
+        for command in linkCommands :
+            self.displayLinkCommand( command , targetPath , ldFlags , libs )
+            try :
+                runCommand = self.getResponseFileCommand( command , self.getLinkResponseFilePath() )
+            except OSError as e :
+                return self._onError( "Cannot write the response file of " + targetPath + " : " + str(e) )
+            try :
+                # a parallel LTO link ( $(JOBS) ) uses the free job slots
+                slots  = noob.jobserver.getJobServer().maxJobs if any( "$(JOBS)" in c for c in runCommand ) else 1
+                result = noob.engine.getEngine().run( runCommand , environment , group = self , slots = slots )
+            except concurrent.futures.CancelledError :
+                if os.path.exists( targetPath ) : os.remove( targetPath )
+                return self._onError( "Link of " + targetPath + " cancelled" )
+            if result.stdout : print( result.stdout.decode( sys.getdefaultencoding() ) )
+            duration += result.duration
+            
+            # check if errors where generated during the link process. A target 
+            # partially updated has to be linked again from scratch
+            if len(result.stderr) != 0:
+                sys.stderr.write( result.stderr.decode( sys.getdefaultencoding() ) )
+                if isIncremental and os.path.exists( targetPath ) : os.remove( targetPath )
+                return self._onError( "Link Error for " + targetPath + " return Code " + str(result.returncode) )
         
         # check if the target has been correctly generated
         if not os.path.exists( targetPath ) : 
             return self._onError( "Error " + targetPath + " doesn't exist" )
         
+        if linkCommands : noob.buildhistory.getBuildHistory().record( targetPath , duration )
+        
+        if linkCacheKey : objectCache.put( linkCacheKey , targetPath )
+        
         # record the new values in the cache if needed
         if len(newLinkCacheDict) > 0 :
             cacheDict.update( newLinkCacheDict )
-            noob.filetools.saveCacheDict( cacheDict ) 
+            noob.filetools.updateCacheDict( newLinkCacheDict ) 
         
         # everything has been successfully built , we can leave now 
         return self._onBuilt( startTime )
@@ -1009,11 +1827,87 @@ class StaticLibraryNode( _CppNode ):
         
         # set the parameters
         self.nodeType = "Static Library" 
+        self.incremental_archive = True
+        self.thin_archive        = False
+        self._hasWarnedThinArchive = False
         self.parms_allowed.update( { "lib_name" : "Name of the generated library ( suffix is automatically determined, and 'lib' may be used as prefix )" } )
         self.parms_allowed.update( { "exact_lib_name" : "Exact name of the generated library. No prefix nor suffix will be added" } )
+        self.parms_allowed.update( { "incremental_archive" : "Only replace the modified objects in the existing library, and remove the ones of the removed sources, if the compiler configuration allows it ( default : True )" } )
+        self.parms_allowed.update( { "thin_archive" : "Build a thin archive, holding references to the objects instead of copies, if the compiler configuration allows it ( default : False )" } )
         _CppNode._setParameters( self , params )
         
         
+    def getArchiveCmdName( self , cmdName ) :
+        # name of the thin version of the command cmdName, if requested and known
+        thinCmdName = cmdName.replace( "static_" , "static_thin_" )
+        if not self.thin_archive : return cmdName
+        if thinCmdName in self._getCompiler() : return thinCmdName
+        if not self._hasWarnedThinArchive :
+            self._hasWarnedThinArchive = True
+            sys.stderr.write( "[WARNING] " + self.name() + " : no thin archives with the compiler configuration '" + self._getCompiler()["config_name"] + "'\n" )
+        return cmdName
+        
+        
+    def getTargetCacheValues( self , objs , targetPath , dependentNodeList ) :
+        # the members of the archive and its command without them
+        archiveCmd = self.getLinkCommand( [] , targetPath , dependentNodeList )[0]
+        return { self.name() + "_members"     : noob.filetools.encodeCommand( objs ) ,
+                 self.name() + "_archive_cmd" : noob.filetools.hashCommand( archiveCmd ) }
+        
+        
+    def getIncrementalLinkCommands( self , objs , targetPath , dependentNodeList , cacheDict , newLinkCacheDict ) :
+        
+        # commands replacing the modified members of the existing archive and removing
+        # the ones of the removed sources, or None if it has to be rebuilt. The members are 
+        # removed by name, or by path from a thin archive : it stores the paths of the objects.
+        # The members of the archive and its command without them are recorded
+        # in newLinkCacheDict, to be cached once the archive is built
+        membersKey    = self.name() + "_members"
+        archiveCmdKey = self.name() + "_archive_cmd"
+        newLinkCacheDict.update( self.getTargetCacheValues( objs , targetPath , dependentNodeList ) )
+        archiveCmd    = newLinkCacheDict[ archiveCmdKey ]
+        
+        updateCmdName = self.getArchiveCmdName( "static_update_cmd" )
+        isThin        = updateCmdName != "static_update_cmd"
+        removeCmdName = "static_thin_remove_cmd" if isThin else "static_remove_cmd"
+        if not self.incremental_archive or not os.path.exists( targetPath ) : return None
+        if updateCmdName not in self._getCompiler() or removeCmdName not in self._getCompiler() : return None
+        
+        # the options or the inherited libraries have changed, or the previous members are unknown
+        previousMembers = noob.filetools.decodeCommand( cacheDict.get( membersKey , "" ) )
+        if not previousMembers or cacheDict.get( archiveCmdKey , "" ) != archiveCmd : return None
+        
+        # the objects modified since the last link have a new value in newLinkCacheDict
+        modifiedObjs = [ o for o in objs if self.name() + o in newLinkCacheDict ]
+        removedObjs  = [ o for o in previousMembers if o not in set( objs ) ]
+        
+        # an archive restored from the object cache may be a hardlink to its entry : 
+        # update a copy of it, not the entry
+        try :
+            if os.stat( targetPath ).st_nlink > 1 :
+                tmpPath = targetPath + ".tmp"
+                shutil.copy2( targetPath , tmpPath )
+                os.replace( tmpPath , targetPath )
+        except OSError :
+            return None
+        
+        commands = []
+        if removedObjs :
+            removeCmd = self._getCompiler()[ removeCmdName ]
+            commands.append( [] )
+            for tok in shlex.split( removeCmd ) :
+                if   not commands[-1]  : commands[-1].append( self.getArchiver( tok ) )
+                elif "$(IN)"  in tok : commands[-1].extend( o if isThin else os.path.basename( o ) for o in removedObjs )
+                elif "$(OUT)" in tok : commands[-1].append( tok.replace( "$(OUT)" , targetPath ) )
+                else                 : commands[-1].append( tok )
+        if modifiedObjs :
+            commands.append( self.getLinkCommand( modifiedObjs , targetPath , dependentNodeList , updateCmdName )[0] )
+        
+        # if the update fails or is killed, the archive will be rebuilt by the next build
+        noob.filetools.updateCacheDict( { membersKey : "" } )
+        return commands
+        
+        
     def targets( self ):
         if   sys.platform in [ "darwin" , "linux" ] : libname = "lib" + self.lib_name
         elif sys.platform == "win32" : libname = self.lib_name
@@ -1038,11 +1932,21 @@ class DynamicLibraryNode( _CppNode ):
         
         # set the parameters
         self.nodeType = "Dynamic Library"
+        self.abi_check = False
         self.parms_allowed.update( { "lib_name" : "Name of the generated library ( suffix is automatically determined, and 'lib' may be used as prefix )" } )
         self.parms_allowed.update( { "exact_lib_name" : "Exact name of the generated library. No prefix nor suffix will be added" } )
+        self.parms_allowed.update( { "abi_check" : "Only relink the nodes linked against this library when its exported symbols or its soname change, not when the body of a function changes ( default : False )" } )
         _CppNode._setParameters( self , params )
         
         
+    def getLinkStamp( self , hash_method ) :
+        # with abi_check, the fingerprint of the exported symbols, if they can be read
+        if self.abi_check :
+            fingerprint = noob.abi.getAbiFingerprint( self.name() )
+            if fingerprint : return "abi:" + fingerprint
+        return _CppNode.getLinkStamp( self , hash_method )
+        
+        
     def targets( self ):
         if self.exact_lib_name : libname = self.exact_lib_name
         else:
@@ -0,0 +1,279 @@
+import os , sys , signal , asyncio , subprocess , threading , time , collections , atexit
+import noob.jobserver
+
+
+# Execution engine of the sub-processes ( compiler , linker , swig ... ) of
+# all the nodes. A single asyncio event loop, running in a background thread,
+# starts the processes and collects their outputs : the threads of the nodes
+# submit commands and are free to prepare the next ones while the processes
+# are running, instead of each waiting for its own process.
+#
+# usage :
+#   future = noob.engine.getEngine().submit( command , environment )
+#   result = future.result() # ProcessResult( returncode , stdout , stderr , duration )
+# or
+#   result = noob.engine.getEngine().run( command , environment )
+#
+# Each process holds a job slot of the process-wide job server while it
+# is running ( see noob.jobserver ). A command may also be limited by its
+# own group, given as limit = ( key , maxProcesses ), ex : the compilation
+# threads of a node.
+#
+# When the job server is adaptive ( see noob.jobserver ), a process waits
+# before taking a slot while :
+#  - the processes of this build and the load of the other programs
+#    ( 1 minute load average ) already keep all the cores busy
+#  - the memory it needs ( given as memory = bytes , ex : its peak at the
+#    previous build ) is more than the available memory, minus what the
+#    running processes are expected to allocate yet
+# A process always starts when nothing else is running. On Linux, the peak
+# memory of each process and its children is sampled in /proc while it runs,
+# and returned with its result.
+#
+# The commands submitted by a node are tagged with it ( group = node ), so
+# they can all be cancelled at once : the commands waiting for a slot are
+# dropped, and the running processes are terminated with all their children
+# ( each process is the leader of its own process group ). The futures of
+# the cancelled commands raise concurrent.futures.CancelledError.
+#
+# A command running several jobs itself ( ex : gcc -flto=$(JOBS) ) may ask
+# for up to slots = N job slots : it holds the ones free when it starts, at
+# least one, and "$(JOBS)" is replaced by their number in its arguments.
+
+# time given to a terminated process to exit before it is killed
+KILL_DELAY = 1.
+SIGKILL    = getattr( signal , "SIGKILL" , signal.SIGTERM ) # processes are always killed on Windows
+
+# adaptive job server : period of the checks of the load and of the memory, 
+# and memory always left to the system and to the other programs
+RESOURCES_CHECK_PERIOD = 0.25
+MEMORY_RESERVE         = 512 * 1024**2
+
+# period of the samples of the memory used by the processes
+MEMORY_SAMPLE_PERIOD   = 0.1
+
+ProcessResult = collections.namedtuple( "ProcessResult" , [ "returncode" , "stdout" , "stderr" , "duration" , "peakMemory" ] )
+
+
+def getAvailableMemory( ) :
+    # memory that can be allocated without swapping, in bytes, or None if unknown
+    try :
+        with open( "/proc/meminfo" , "rb" ) as meminfoFile :
+            for line in meminfoFile :
+                if line.startswith( b"MemAvailable:" ) : return int( line.split()[1] ) * 1024
+    except ( OSError , ValueError , IndexError ) :
+        pass
+    return None
+
+
+def getProcessTreeMemory( pid ) :
+    # sum of the peak resident memory ( VmHWM ) of a process and of its 
+    # running children, in bytes, or None if unknown ( Linux only )
+    total   = None
+    toVisit = [ pid ]
+    while toVisit :
+        pid = toVisit.pop()
+        try :
+            with open( "/proc/%d/status" % pid , "rb" ) as statusFile :
+                for line in statusFile :
+                    if line.startswith( b"VmHWM:" ) :
+                        total = ( total or 0 ) + int( line.split()[1] ) * 1024
+                        break
+            with open( "/proc/%d/task/%d/children" % ( pid , pid ) , "rb" ) as childrenFile :
+                toVisit += [ int( child ) for child in childrenFile.read().split() ]
+        except ( OSError , ValueError , IndexError ) :
+            pass # process over, or no /proc
+    return total
+
+
+class Engine( object ) :
+
+    def __init__( self ) :
+        self.loop       = asyncio.new_event_loop()
+        self.semaphores = {}    # only used from the loop thread
+        self.tasks      = {}    # group -> running tasks , only used from the loop thread
+        self.cancelled  = set() # groups cancelled until reset()
+        self.processes  = set() # running processes
+        self.jobs       = {}    # admitted job -> [ expected peak memory , measured peak memory ] , only used from the loop thread
+        self.thread     = threading.Thread( target = self._runLoop , name = "noob-engine" , daemon = True )
+        self.thread.start()
+        
+        # the processes are not in the process group of the terminal anymore : 
+        # they wouldn't be stopped by Ctrl+C with this process
+        atexit.register( self._killAll )
+
+
+    def _runLoop( self ) :
+        asyncio.set_event_loop( self.loop )
+        self.loop.run_forever()
+
+
+    def _getSemaphore( self , key , size ) :
+        if ( key , size ) not in self.semaphores :
+            self.semaphores[ ( key , size ) ] = asyncio.Semaphore( size )
+        return self.semaphores[ ( key , size ) ]
+
+
+    def submit( self , command , environment = None , limit = None , group = None , memory = 0 , slots = 1 ) :
+        # start command as soon as possible, and return a concurrent.futures.Future of its ProcessResult
+        return asyncio.run_coroutine_threadsafe( self._run( command , environment , limit , group , memory , slots ) , self.loop )
+
+
+    def run( self , command , environment = None , limit = None , group = None , memory = 0 , slots = 1 ) :
+        # start command and wait for its ProcessResult
+        return self.submit( command , environment , limit , group , memory , slots ).result()
+
+
+    def cancel( self , group ) :
+        # cancel all the commands of group, and the ones submitted until reset( group ).
+        # Returns once the running processes have been asked to terminate
+        self.cancelled.add( group )
+        asyncio.run_coroutine_threadsafe( self._cancel( group ) , self.loop ).result()
+
+
+    def reset( self , group ) :
+        self.cancelled.discard( group )
+
+
+    async def _cancel( self , group ) :
+        for task in list( self.tasks.get( group , [] ) ) :
+            task.cancel()
+
+
+    async def _run( self , command , environment , limit , group , memory , slots ) :
+        if group in self.cancelled : raise asyncio.CancelledError()
+
+        task = asyncio.current_task()
+        self.tasks.setdefault( group , set() ).add( task )
+        try :
+            if limit == None :
+                return await self._runWhenResourcesAvailable( command , environment , memory , slots )
+
+            async with self._getSemaphore( *limit ) :
+                return await self._runWhenResourcesAvailable( command , environment , memory , slots )
+        finally :
+            self.tasks[ group ].discard( task )
+            if not self.tasks[ group ] : del self.tasks[ group ]
+
+
+    def _hasResources( self , memory ) :
+
+        # a job can always start alone
+        if not self.jobs : return True
+
+        # the cores not used by the other programs
+        if hasattr( os , "getloadavg" ) :
+            otherLoad = max( 0. , os.getloadavg()[0] - len( self.jobs ) )
+            if len( self.jobs ) >= max( 1. , ( os.cpu_count() or 1 ) - otherLoad ) : return False
+
+        # the memory not used yet, nor about to be used by the running jobs
+        if memory > 0 :
+            availableMemory = getAvailableMemory()
+            if availableMemory != None :
+                pendingMemory = sum( max( 0 , expected - measured ) for expected , measured in self.jobs.values() )
+                if memory + pendingMemory + MEMORY_RESERVE > availableMemory : return False
+
+        return True
+
+
+    async def _runWhenResourcesAvailable( self , command , environment , memory , slots ) :
+
+        # wait for enough cores and memory if the job server is adaptive
+        if noob.jobserver.getJobServer().isAdaptive :
+            while not self._hasResources( memory ) :
+                await asyncio.sleep( RESOURCES_CHECK_PERIOD )
+
+        job = object()
+        self.jobs[ job ] = [ memory , 0 ]
+        try :
+            return await self._runWithJobSlot( command , environment , job , slots )
+        finally :
+            del self.jobs[ job ]
+
+
+    async def _sampleMemory( self , process , job ) :
+        # record the peak memory of process in self.jobs[ job ] until it is over
+        while process.returncode == None :
+            peakMemory = getProcessTreeMemory( process.pid )
+            if peakMemory == None : return
+            self.jobs[ job ][1] = max( self.jobs[ job ][1] , peakMemory )
+            await asyncio.sleep( MEMORY_SAMPLE_PERIOD )
+
+
+    async def _runWithJobSlot( self , command , environment , job , slots ) :
+
+        # only as many coroutines as job slots wait for the job server, which
+        # may block on the pipe of a parent make : it is done in a thread
+        jobServer = noob.jobserver.getJobServer()
+        async with self._getSemaphore( jobServer , jobServer.maxJobs ) :
+            acquiring = self.loop.run_in_executor( None , jobServer.acquire )
+            try :
+                token = await asyncio.shield( acquiring )
+            except asyncio.CancelledError :
+                # give the slot back as soon as it is acquired
+                acquiring.add_done_callback( lambda f : jobServer.release( f.result() ) )
+                raise
+            
+            # the other slots asked for, if they are free right now
+            extraSlots = 0
+            while extraSlots < slots - 1 and jobServer.tryAcquire() : extraSlots += 1
+            command    = [ c.replace( "$(JOBS)" , str( 1 + extraSlots ) ) for c in command ]
+            try :
+                startTime = time.time()
+                process   = await asyncio.create_subprocess_exec( *command , stdout = asyncio.subprocess.PIPE , stderr = asyncio.subprocess.PIPE , env = environment ,
+                                                                  **self._getProcessGroupArgs() )
+                self.processes.add( process )
+                sampling = self.loop.create_task( self._sampleMemory( process , job ) )
+                try :
+                    ( stdout , stderr ) = await process.communicate()
+                except asyncio.CancelledError :
+                    # don't wait for the process to exit
+                    self._signal( process , signal.SIGTERM )
+                    self.loop.create_task( self._reap( process ) )
+                    raise
+                finally :
+                    sampling.cancel()
+                self.processes.discard( process )
+                return ProcessResult( process.returncode , stdout , stderr , time.time() - startTime , self.jobs[ job ][1] or None )
+            finally :
+                jobServer.release( token )
+                for _ in range( extraSlots ) : jobServer.release( None )
+
+
+    def _getProcessGroupArgs( self ) :
+        # make each process the leader of a new process group, to stop its children with it
+        if sys.platform == "win32" : return { "creationflags" : subprocess.CREATE_NEW_PROCESS_GROUP }
+        return { "start_new_session" : True }
+
+
+    def _signal( self , process , sig ) :
+        try :
+            if sys.platform == "win32" : process.kill()
+            else                       : os.killpg( process.pid , sig )
+        except OSError :
+            pass # already over
+
+
+    async def _reap( self , process ) :
+        # kill the process if it doesn't exit after SIGTERM
+        try :
+            await asyncio.wait_for( process.wait() , KILL_DELAY )
+        except asyncio.TimeoutError :
+            self._signal( process , SIGKILL )
+            await process.wait()
+        self.processes.discard( process )
+
+
+    def _killAll( self ) :
+        for process in list( self.processes ) :
+            if process.returncode == None : self._signal( process , SIGKILL )
+
+
+_engine     = None
+_engineLock = threading.Lock()
+
+def getEngine( ) :
+    global _engine
+    with _engineLock :
+        if _engine == None : _engine = Engine()
+        return _engine
@@ -1,5 +1,9 @@
 import os
 import hashlib
+import threading
+import sqlite3
+import json
+import time
 
 def makeAbsolutePath( callingPath , paths ) :
     if type(paths) == list :
@@ -18,35 +22,206 @@ def makeAbsolutePath( callingPath , paths ) :
         
     
 
-def loadCacheDict() :
-    if not os.path.exists( ".noob_cache" ) : return {}
-    
-    cacheDict = {}
-    with open(".noob_cache" , 'r' ) as cache :
-        l = cache.readline()
-        while l!="":
-            cacheDict[ l.split(':')[0] ] = l.split(':',1)[1][:-1] # one left split and remove last char '\n' 
-            l = cache.readline()
+## =========================
+##  Build cache
+## =========================
+
+# The values recorded between two builds ( file hashes, command digests , ... ) 
+# are stored in an SQLite database, so the cache is updated incrementally and
+# each batch of values is written atomically : a killed build leaves the cache
+# as it was after the last committed batch. 
+CACHE_PATH = ".noob_cache.db"
+
+# tables of values computed from the content of a file, valid as long as
+# the stat data of the file is unchanged : table name -> value column
+FILE_VALUE_TABLES = {
+    "stats"    : "digest"   , # digest of the content
+    "includes" : "includes" , # names included with '#include "..."'
+    "abi"      : "fingerprint" , # exported symbols of a shared library ( see noob.abi )
+}
+
+class BuildCache( object ) :
+    
+    def __init__( self , cachePath = CACHE_PATH , batchSize = 256 , batchDelay = 2. ) :
+        self.cachePath  = cachePath
+        self.lock       = threading.Lock()
+        
+        # values waiting to be written, flushed when the batch is full or too old
+        self.pendingValues  = {}
+        self.batchSize      = batchSize
+        self.batchDelay     = batchDelay
+        self.lastFlushTime  = time.time()
+        
+        # the connection is shared between threads, and only used under self.lock
+        self.connection = sqlite3.connect( cachePath , check_same_thread = False , isolation_level = None )
+        self.connection.execute( "PRAGMA journal_mode = WAL"   )
+        self.connection.execute( "PRAGMA synchronous  = NORMAL" )
+        self.connection.execute( "CREATE TABLE IF NOT EXISTS cache ( key TEXT PRIMARY KEY , value TEXT )" )
+        for table , column in FILE_VALUE_TABLES.items() :
+            self.connection.execute( "CREATE TABLE IF NOT EXISTS " + table + " ( path TEXT PRIMARY KEY , stamp TEXT , " + column + " TEXT )" )
+        
+        # keep all the values in memory, the database is only read once
+        self.values = dict( self.connection.execute( "SELECT key , value FROM cache" ) )
+        
+        # values computed from the files, valid as long as their stat stamp is unchanged
+        self.fileValues        = {}
+        self.pendingFileValues = {}
+        for table , column in FILE_VALUE_TABLES.items() :
+            self.fileValues       [ table ] = { path : ( stamp , value ) for path , stamp , value in self.connection.execute( "SELECT path , stamp , " + column + " FROM " + table ) }
+            self.pendingFileValues[ table ] = {}
+        
+    
+    def get( self , key , default = None ) :
+        with self.lock :
+            return self.values.get( key , default )
+        
+    
+    def load( self ) :
+        with self.lock :
+            return dict( self.values )
+        
+    
+    def update( self , newValues , isBatched = False ) :
+        with self.lock :
+            self.values       .update( newValues )
+            self.pendingValues.update( newValues )
             
-    return cacheDict
+            isBatchFull = len( self.pendingValues ) >= self.batchSize
+            isBatchOld  = time.time() - self.lastFlushTime >= self.batchDelay
+            if not isBatched or isBatchFull or isBatchOld : self._flush()
+    
+    
+    def getFileValue( self , table , filePath , computeValue , stampSuffix = "" ) :
+        
+        # value computed by computeValue( filePath ), only computed again if 
+        # the modification time, the size or the inode of the file has changed
+        stat  = os.stat( filePath )
+        stamp = "%d:%d:%d%s" % ( stat.st_mtime_ns , stat.st_size , stat.st_ino , stampSuffix )
+        with self.lock :
+            cached = self.fileValues[ table ].get( filePath )
+            if cached and cached[0] == stamp : return cached[1]
+        
+        value = computeValue( filePath )
+        
+        # a file modified in the last seconds may be modified again without 
+        # changing its stamp ( coarse mtime resolution ) : don't trust it yet
+        if time.time() - stat.st_mtime < 2. : return value
+        
+        with self.lock :
+            self.fileValues       [ table ][ filePath ] = ( stamp , value )
+            self.pendingFileValues[ table ][ filePath ] = ( stamp , value )
+            if len( self.pendingFileValues[ table ] ) >= self.batchSize : self._flush()
+        return value
+        
+    
+    def getFileDigest( self , filePath , algorithm ) :
+        return self.getFileValue( "stats" , filePath , lambda p : hashFile( p , algorithm ) , ":" + algorithm )
+        
+    
+    def flush( self ) :
+        with self.lock :
+            self._flush()
+    
+    
+    def _flush( self ) :
+        if self.pendingValues or any( self.pendingFileValues.values() ) :
+            # a single transaction per batch
+            with self.connection :
+                self.connection.execute( "BEGIN" )
+                self.connection.executemany( "INSERT OR REPLACE INTO cache ( key , value ) VALUES ( ? , ? )" , self.pendingValues.items() )
+                for table , pendingValues in self.pendingFileValues.items() :
+                    self.connection.executemany( "INSERT OR REPLACE INTO " + table + " VALUES ( ? , ? , ? )" , 
+                                                 [ ( path , stamp , value ) for path , ( stamp , value ) in pendingValues.items() ] )
+                    pendingValues.clear()
+            self.pendingValues = {}
+        self.lastFlushTime = time.time()
+    
+
+_buildCaches     = {}
+_buildCachesLock = threading.Lock()
+
+def getBuildCache() :
+    # one cache per working directory, as for the previous .noob_cache file
+    cachePath = os.path.abspath( CACHE_PATH )
+    with _buildCachesLock :
+        if cachePath not in _buildCaches : _buildCaches[ cachePath ] = BuildCache( cachePath )
+        return _buildCaches[ cachePath ]
+        
+
+def _toCacheStr( keyOrValue ) :
+    if type( keyOrValue ) == type( hashlib.md5() ) : return keyOrValue.hexdigest()
+    return str( keyOrValue )
+    
+
+def loadCacheDict() :
+    return getBuildCache().load()
     
 
 def saveCacheDict( cacheDict ) :
-    with open(".noob_cache" ,"w") as cache :
-        for k,v in cacheDict.items() :
-            cache.write( str(k) + ":" + str(v) + "\n" )
+    getBuildCache().update( cacheDict )
+    
+
+def updateCacheDict( newValues ) :
+    getBuildCache().update( newValues )
+    
+
+def queueCacheDict( newValues ) :
+    # the values are written with the next batch : use it when many values are
+    # recorded in a row ( one per compiled object ), then call flushCacheDict()
+    getBuildCache().update( newValues , isBatched = True )
+    
+
+def flushCacheDict() :
+    getBuildCache().flush()
+    
+
+def getCachedValue( key ) :
+    return getBuildCache().get( _toCacheStr( key ) , "" )
     
 
 def setCacheStrValue( key , value ):
-    if type( key   ) == type( hashlib.md5() ) : key   = key.hexdigest()
-    if type( value ) == type( hashlib.md5() ) : value = value.hexdigest()
-    cacheDict      = loadCacheDict()
-    cacheDict[key] = value
-    saveCacheDict( cacheDict )
+    updateCacheDict( { _toCacheStr( key ) : _toCacheStr( value ) } )
     
         
 def setCacheValue( key , value  ):
     setCacheStrValue( key , value )
+    
+
+def hashCommand( args ) :
+    # digest of a command recorded in the cache. The options are in the same
+    # order from a run to another, and their order matters to the compiler
+    return hashlib.md5( "\0".join( args ).encode( "utf-8" , "surrogateescape" ) ).hexdigest()
+    
+
+def encodeCommand( args ) :
+    # readable version of a command, to be able to display what has changed
+    return json.dumps( list( args ) )
+    
+
+def decodeCommand( value ) :
+    try :
+        return json.loads( value ) if value else []
+    except ValueError :
+        return []
+
+        
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def hashFile( filePath , algorithm = "md5" ) :
+    # digest of the content of a file, read by chunks so big libraries 
+    # are never loaded entirely in memory. algorithm is any name known
+    # by hashlib.new() : "md5" , "sha1" , "blake2b" ...
+    digest = hashlib.new( algorithm )
+    with open( filePath , "rb" ) as f :
+        for chunk in iter( lambda : f.read( HASH_CHUNK_SIZE ) , b"" ) :
+            digest.update( chunk )
+    return digest.hexdigest()
+    
+
+def hashFileHybrid( filePath , algorithm = "md5" ) :
+    # same as hashFile(), but the digest is reused from the previous builds
+    # as long as the stat data of the file is unchanged
+    return getBuildCache().getFileDigest( filePath , algorithm )
 
         
 def rmFile( filePath ):
@@ -0,0 +1,80 @@
+import os , sys
+import noob.session
+
+
+# In-memory index of the include directories, to locate the files named by
+# "#include" directives without probing the filesystem for every directory
+# of every include. Each directory is listed once per build, and the result
+# of each lookup ( list of directories , included name ) is shared by all the
+# nodes searching the same directories. The index of a build is owned by its
+# session ( see noob.session ), and bounded as its other caches.
+
+# os.path.exists() ignores the case on these platforms
+IS_CASE_INSENSITIVE = sys.platform in [ "win32" , "darwin" ]
+
+# value of a lookup not done yet, a file not found being None
+_UNKNOWN = object()
+
+
+class IncludeIndex( object ) :
+
+    def __init__( self , maxEntries = 100000 ) :
+        self.listings = noob.session.BoundedCache( maxEntries ) # directory -> set of the names it contains
+        self.lookups  = noob.session.BoundedCache( maxEntries ) # ( directories , name ) -> path or None
+
+
+    def clear( self ) :
+        # forget everything, the files may have changed since the last build
+        self.listings.clear()
+        self.lookups .clear()
+
+
+    def _normName( self , name ) :
+        return name.lower() if IS_CASE_INSENSITIVE else name
+
+
+    def _listDir( self , dirPath ) :
+        names = self.listings.get( dirPath )
+        if names != None : return names
+
+        try :
+            with os.scandir( dirPath ) as entries :
+                names = frozenset( self._normName( entry.name ) for entry in entries )
+        except OSError :
+            # missing or unreadable directory
+            names = frozenset()
+
+        self.listings.set( dirPath , names )
+        return names
+
+
+    def _exists( self , dirPath , name ) :
+        # "name" may be a sub-path, ex : "sys/types.h"
+        parts = name.replace( "\\" , "/" ).split( "/" )
+        if ".." in parts or "." in parts or "" in parts :
+            return os.path.exists( os.path.join( dirPath , name ) )
+
+        for part in parts :
+            if self._normName( part ) not in self._listDir( dirPath ) : return False
+            dirPath = os.path.join( dirPath , part )
+        return True
+
+
+    def resolve( self , dirPaths , name ) :
+        # path of the first file called "name" in the directories dirPaths, or None
+        key = ( tuple( dirPaths ) , name )
+        path = self.lookups.get( key , _UNKNOWN )
+        if path is not _UNKNOWN : return path
+
+        if os.path.isabs( name ) :
+            path = name if os.path.exists( name ) else None
+        else :
+            path = None
+            for dirPath in dirPaths :
+                if self._exists( dirPath , name ) :
+                    path = os.path.join( dirPath , name )
+                    break
+
+        self.lookups.set( key , path )
+        return path
+
@@ -0,0 +1,153 @@
+import os , sys , re , select , threading , contextlib
+
+
+# Process-wide pool of job slots. Every sub-process launched by noob
+# ( compiler , linker , swig , pyinstaller ... ) holds a slot while it is
+# running, so the machine is never oversubscribed, even when several nodes
+# are evaluated at the same time with their own compilation threads.
+#
+# When noob is launched by a parent "make -jN", the pool also acts as a
+# client of the GNU make jobserver : a make child owns one implicit slot,
+# and has to read a token from the jobserver pipe ( or fifo ) before starting
+# any other job, then write it back once the job is over.
+#
+# Without an explicit limit ( maxJobs None or "auto" ), the pool is adaptive :
+# it has one slot per core, and the engine starts fewer processes when the
+# machine is loaded by other programs or short of memory ( see noob.engine ).
+
+IMPLICIT_TOKEN = b""
+
+
+class JobServer( object ) :
+
+    def __init__( self , maxJobs = None , useMakeJobServer = True ) :
+
+        # local limit, whether or not a make jobserver is found
+        if maxJobs == "auto" : maxJobs = None
+        self.isAdaptive = maxJobs == None
+        self.maxJobs    = maxJobs or os.cpu_count() or 1
+        self.slots      = threading.Semaphore( self.maxJobs )
+
+        # make jobserver properties
+        self.implicitSlot = threading.Lock()
+        self.readFd       = None
+        self.writeFd      = None
+
+        if useMakeJobServer :
+            self._connectMakeJobServer( os.environ.get( "MAKEFLAGS" , "" ) )
+
+
+    def _connectMakeJobServer( self , makeFlags ) :
+
+        # the jobserver is given in MAKEFLAGS as :
+        #  - "--jobserver-auth=fifo:PATH" ( make >= 4.4 )
+        #  - "--jobserver-auth=R,W"       ( make >= 4.2 )
+        #  - "--jobserver-fds=R,W"        ( older make )
+        # on Windows make uses a named semaphore , which is not supported here
+        if sys.platform == "win32" : return
+
+        auths = re.findall( r'--jobserver-(?:auth|fds)=(\S+)' , makeFlags )
+        if not auths : return
+        auth = auths[-1] # the last one wins, as for make
+
+        try :
+            if auth.startswith( "fifo:" ) :
+                fd = os.open( auth[5:] , os.O_RDWR )
+                self.readFd , self.writeFd = fd , fd
+            else :
+                readFd , writeFd = [ int(fd) for fd in auth.split(",") ]
+
+                # negative fds : make disabled the jobserver for this command
+                if readFd < 0 or writeFd < 0 : return
+
+                # the fds are only inherited if the make rule is marked with '+'
+                os.fstat( readFd  )
+                os.fstat( writeFd )
+                self.readFd , self.writeFd = readFd , writeFd
+
+        except ( OSError , ValueError ) as e :
+            sys.stderr.write( "[WARNING] make jobserver '" + auth + "' unavailable : " + str(e) + "\n" )
+            sys.stderr.write( "[WARNING] using " + str( self.maxJobs ) + " local job slots only\n\n" )
+
+
+    def isMakeClient( self ) :
+        return self.readFd != None
+
+
+    def acquire( self ) :
+
+        # block until a slot is free, and return the token to give back to release()
+        self.slots.acquire()
+        if self.readFd == None : return None
+
+        # the first slot is the one given implicitly by make to this process
+        if self.implicitSlot.acquire( blocking = False ) : return IMPLICIT_TOKEN
+
+        # otherwise wait for a token from the make jobserver
+        while True :
+            try :
+                token = os.read( self.readFd , 1 )
+                if token : return token
+
+                # end of file : the parent make has gone, don't wait anymore
+                return None
+
+            except BlockingIOError :
+                # the pipe may have been left non-blocking by make
+                select.select( [ self.readFd ] , [] , [] )
+            except InterruptedError :
+                pass
+            except OSError :
+                return None
+
+
+    def tryAcquire( self ) :
+        # take a free local slot without waiting, for a process running several
+        # jobs itself ( ex : gcc -flto=N ). Not as a make client : the tokens of
+        # the parent make are only waited for by acquire(). Give it back with release( None )
+        if self.readFd != None : return False
+        return self.slots.acquire( blocking = False )
+    
+    
+    def release( self , token ) :
+        try :
+            if   token == IMPLICIT_TOKEN : self.implicitSlot.release()
+            elif token != None           : os.write( self.writeFd , token )
+        finally :
+            self.slots.release()
+
+
+_jobServer     = None
+_jobServerLock = threading.Lock()
+
+def getJobServer( ) :
+    global _jobServer
+    with _jobServerLock :
+        if _jobServer == None : _jobServer = JobServer()
+        return _jobServer
+
+
+def setMaxJobs( maxJobs ) :
+    # replace the process-wide pool if the limit changed. Slots currently
+    # in use are given back to the pool they were taken from
+    global _jobServer
+    with _jobServerLock :
+        if maxJobs == "auto" : maxJobs = None
+        if _jobServer == None or _jobServer.isAdaptive != ( maxJobs == None ) or ( maxJobs and _jobServer.maxJobs != maxJobs ) :
+            _jobServer = JobServer( maxJobs )
+        return _jobServer
+
+
+@contextlib.contextmanager
+def jobSlot( ) :
+    # usage :
+    #   with noob.jobserver.jobSlot() :
+    #       process = subprocess.Popen( ... )
+    #       process.communicate()
+    jobServer = getJobServer()
+    token     = jobServer.acquire()
+    try :
+        yield
+    finally :
+        jobServer.release( token )
+
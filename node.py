@@ -1,5 +1,12 @@
 #from multiprocessing import Pool
-import sys
+import sys , os , time , heapq
+import concurrent.futures
+import noob.jobserver
+import noob.buildhistory
+import noob.objcache
+import noob.filetools
+import noob.session
+import noob.engine
 
 class Node( object ) :
     
@@ -21,9 +28,24 @@ class Node( object ) :
         self.start_cb = None
         self.end_cb   = None
         
+        # caches shared with the other nodes of the build ( see noob.session )
+        self._session = None
+        
+        # set to stop the evaluation of this node as soon as possible
+        self.cancelAll = False
+        
+        # number of nodes evaluated at the same time by execute()
+        self.num_node_thread = os.cpu_count() or 4
+        
+        # maximum number of sub-processes running at the same time 
+        # for the whole build ( None or "auto" : adaptive, see noob.jobserver )
+        self.max_jobs = None
+        
         self.parms_allowed = {
-            "start_cb" : "callback to invoke when the evaluation of the node starts" , 
-            "end_cb"   : "callback to invoke when the evaluation of the node ends"  
+            "start_cb"        : "callback to invoke when the evaluation of the node starts" , 
+            "end_cb"          : "callback to invoke when the evaluation of the node ends"   ,
+            "num_node_thread" : "Number of independent nodes evaluated simultaneously ( default : number of cores )" ,
+            "max_jobs"        : "Maximum number of sub-processes ( compiler, linker, ... ) running at the same time across all nodes, also bounded by a parent 'make -j'. 'auto' : number of cores, fewer when the machine is loaded or short of memory ( default : 'auto' )"
         }
         
         
@@ -39,54 +61,213 @@ class Node( object ) :
     def help( self ) :
         pass
     
+    def getDependencyMap( self ) :
+        
+        # compute in a single depth-first traversal the topological order of
+        # the nodes this node depends on ( parents before children ), then 
+        # derive for each node the ordered list of all the nodes it depends
+        # on directly or indirectly. Raise an error if the graph has a cycle
+        VISITING , VISITED = 1 , 2
+        
+        nodeState    = { self : VISITING }
+        topoSequence = []
+        stack        = [ ( self , iter( self.parentNodeList ) ) ]
+        
+        while stack :
+            node , parents = stack[-1]
+            for parent in parents :
+                state = nodeState.get( parent )
+                if state == None :
+                    # first visit of this parent : go deeper
+                    nodeState[parent] = VISITING
+                    stack.append( ( parent , iter( parent.parentNodeList ) ) )
+                    break
+                elif state == VISITING :
+                    # this parent is still on the stack : we've found a cycle
+                    cycle = [ n for n,_ in stack ]
+                    cycle = cycle[ cycle.index( parent ) : ] + [ parent ]
+                    raise RuntimeError( "Cycle detected in the node graph : " + " -> ".join( str(n) for n in cycle ) )
+            else :
+                # all parents have been visited
+                stack.pop()
+                nodeState[node] = VISITED
+                topoSequence.append( node )
+        
+        # the dependencies of a node are its parents and their own dependencies,
+        # sorted according to the topological order
+        topoIndex     = { node : i for i,node in enumerate( topoSequence ) }
+        dependentSet  = {}
+        dependencyMap = {}
+        for node in topoSequence :
+            nodeSet = set()
+            for parent in node.parentNodeList :
+                nodeSet |= dependentSet[parent]
+                nodeSet.add( parent )
+            dependentSet [node] = nodeSet
+            dependencyMap[node] = sorted( nodeSet , key = topoIndex.__getitem__ )
+        
+        return dependencyMap
+        
+        
     def getDependentList( self ) :
-        nodeSequenceList = [ ] 
-        nodeToVisitList  = [ self ]
-        level            = 1
-        
-        # generate the linear sequence of dependencies ( Pixo's style ) 
-        while len( nodeToVisitList ) != 0 :
-            for node in nodeToVisitList[:] :
-                for parent in node.parentNodeList :
-                    if parent in nodeSequenceList : 
-                        nodeSequenceList.remove( parent )
-                    
-                    nodeSequenceList.append( parent ) 
-                    
-                    if parent not in nodeToVisitList : nodeToVisitList.append( parent ) 
-                
-                nodeToVisitList.remove( node ) 
-                
-            level += 1
-            
-        nodeSequenceList = list( reversed( nodeSequenceList ) )
+        return self.getDependencyMap()[ self ]
+        
+        
+    def cancel( self ) :
+        # stop the evaluation of this node : nothing new is started, and
+        # its sub-processes still running are terminated
+        self.cancelAll = True
+        noob.engine.getEngine().cancel( self )
         
-        return nodeSequenceList
         
+    def getSession( self ) :
+        # session of the last build, or a new one if this node has never been built
+        if self._session == None : self._session = noob.session.BuildSession()
+        return self._session
         
-    def execute( self , **kwargs ) : 
         
-        self.nodeSequenceList = self.getDependentList()
+    def phases( self ) :
+        # phases evaluated in sequence to build this node, as a list of 
+        # ( methodName , waitForParents ). A phase that doesn't wait for 
+        # the parents may start before they are completely built
+        return [ ( "evaluate" , True ) ]
         
-        # for each node, compute the dependent sequence list
-        for node in self.nodeSequenceList :
-            node.nodeSequenceList = node.getDependentList() 
         
-        # start the execution node by node
-        for n in self.nodeSequenceList + [ self ] : 
+    def estimateDuration( self , phaseName ) :
+        # estimated duration in seconds of a phase of this node, as measured 
+        # the last times this node was actually built
+        return noob.buildhistory.getBuildHistory().estimate( self.name() + ":" + phaseName , 0. )
+        
+        
+    def _evaluatePhase( self , node , phaseIndex , **kwargs ) :
+        phaseName , _ = node.phases()[ phaseIndex ]
+        
+        if phaseIndex == 0 :
             print( "-------------------------" )
-            print( "Building '" + n.nodeType + "' , Target : \"" + n.name() + "\""  )
+            print( "Building '" + node.nodeType + "' , Target : \"" + node.name() + "\""  )
             
             # invoke start callback if defined
-            if n.start_cb != None : n.start_cb( n )
-            
-            # evaluate the node
-            n.evaluate( **kwargs )
-            
-            # invoke end callback if defined
-            if n.end_cb != None : n.end_cb( n )
+            if node.start_cb != None : node.start_cb( node )
+        
+        # evaluate this phase of the node, and keep its duration for the next builds
+        startTime = time.time()
+        try :
+            getattr( node , phaseName )( **kwargs )
+        except concurrent.futures.CancelledError :
+            # a sub-process of this node has been cancelled, by a failure of another node
+            sys.stderr.write( "[ERROR] " + node.nodeType + " : \"" + node.name() + "\" cancelled\n\n" )
+            node.status = "Error"
+        if node.status == "Built" :
+            noob.buildhistory.getBuildHistory().record( node.name() + ":" + phaseName , time.time() - startTime )
+        
+        # invoke end callback if defined, once the node is over
+        if phaseIndex == len( node.phases() ) - 1 or "Error" in node.status :
+            if node.end_cb != None : node.end_cb( node )
+        
+        return node
+        
+        
+    def execute( self , session = None , **kwargs ) : 
+        
+        # compute once the dependent sequence list of every node
+        dependencyMap = self.getDependencyMap()
+        for node , nodeSequenceList in dependencyMap.items() :
+            node.nodeSequenceList = nodeSequenceList
+        
+        # all the nodes of this build share the same caches. A session given by 
+        # the caller may be reused by several builds : its answers about the 
+        # state of the files are forgotten, the files may have changed since
+        if session == None : session = noob.session.BuildSession()
+        session.beginBuild()
+        for node in dependencyMap.keys() : 
+            node._session = session
+        
+        # split the evaluation of each node in tasks, one per phase. A task 
+        # starts as soon as the previous phase of its node is over and, if 
+        # it waits for the parents, once the last phase of all the parents 
+        # of its node are over. For each task, count the number of tasks it
+        # is still waiting for, and which tasks are waiting for it
+        allNodes     = self.nodeSequenceList + [ self ]
+        phaseMap     = { n : n.phases() for n in allNodes }
+        lastTask     = {}
+        waitingCount = {}
+        waitingTasks = {}
+        for n in allNodes : # parents are always before their children
+            phases = phaseMap[n]
+            for phaseIndex , ( phaseName , waitForParents ) in enumerate( phases ) :
+                task                 = ( n , phaseIndex )
+                waitingTasks[ task ] = []
+                
+                previousTasks = [ ( n , phaseIndex - 1 ) ] if phaseIndex > 0 else []
+                if waitForParents : 
+                    previousTasks += [ lastTask[parent] for parent in set( n.parentNodeList ) ]
+                
+                waitingCount[ task ] = len( previousTasks )
+                for previousTask in previousTasks : waitingTasks[ previousTask ].append( task )
+                
+            lastTask[n] = ( n , len( phases ) - 1 )
+        
+        # the priority of a task is the estimated duration of the longest chain of 
+        # tasks starting with it : tasks on the critical path are started first.
+        # Tasks have been created in topological order, so the tasks waiting 
+        # for a task are always processed before it when reversing this order
+        taskPriority = {}
+        for task in reversed( list( waitingTasks.keys() ) ) :
+            n , phaseIndex = task
+            longestNext    = max( [ taskPriority[t] for t in waitingTasks[task] ] , default = 0. )
+            taskPriority[ task ] = n.estimateDuration( phaseMap[n][phaseIndex][0] ) + longestNext
+        
+        # ready tasks are kept in a heap, sorted by priority then by creation order
+        taskOrder  = { task : i for i,task in enumerate( waitingTasks.keys() ) }
+        readyTasks = []
+        def pushReadyTask( task ) : 
+            heapq.heappush( readyTasks , ( -taskPriority[task] , taskOrder[task] , task ) )
+        
+        for task,count in waitingCount.items() :
+            if count == 0 : pushReadyTask( task )
+        hasFailed = False
+        
+        # all nodes share the same pool of job slots
+        if self.max_jobs != None : noob.jobserver.setMaxJobs( self.max_jobs )
+        
+        # start the execution, independent tasks are evaluated concurrently
+        with concurrent.futures.ThreadPoolExecutor( max_workers = self.num_node_thread ) as executor :
+            runningTasks = {}
             
-            if "Error" in n.status : sys.exit(-1)
+            while readyTasks or runningTasks :
+                
+                # start the tasks with the highest priority first
+                # and don't start anything new once a node has failed
+                if hasFailed : readyTasks.clear()
+                while readyTasks and len( runningTasks ) < self.num_node_thread :
+                    _ , _ , ( n , phaseIndex ) = heapq.heappop( readyTasks )
+                    runningTasks[ executor.submit( self._evaluatePhase , n , phaseIndex , **kwargs ) ] = ( n , phaseIndex )
+                
+                if not runningTasks : break
+                
+                # wait for at least one task to finish, and release the tasks waiting for it
+                doneFutures , _ = concurrent.futures.wait( runningTasks , return_when = concurrent.futures.FIRST_COMPLETED )
+                for future in doneFutures :
+                    task = runningTasks.pop( future )
+                    future.result() # re-raise exceptions from the evaluation
+                    
+                    if "Error" in task[0].status : 
+                        hasFailed = True
+                        
+                        # stop the other nodes running, unless they're asked to go on
+                        if getattr( task[0] , "stop_on_error" , True ) :
+                            for n,_ in runningTasks.values() : n.cancel()
+                        continue
+                    
+                    for waitingTask in waitingTasks[ task ] :
+                        waitingCount[ waitingTask ] -= 1
+                        if waitingCount[ waitingTask ] == 0 : pushReadyTask( waitingTask )
+        
+        noob.buildhistory.getBuildHistory().save()
+        noob.objcache.flushUploads()
+        noob.filetools.flushCacheDict()
+        
+        if hasFailed : sys.exit(-1)
         
     
     def __repr__( self ) :
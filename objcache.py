@@ -0,0 +1,315 @@
+import os , sys , shutil , threading , hashlib , uuid , queue , json , tempfile
+import urllib.request
+
+
+# Content-addressed store of build products ( compiled objects ), shared by
+# all the nodes and all the builds using the same cache directory. An entry
+# is keyed by a digest of everything the product depends on, so switching
+# back to a previous version of a source, of a header or of the flags
+# restores the previous object instead of recompiling it.
+#
+# Entries are stored as <cacheDir>/<2 first chars of the key>/<rest of the key>
+# and their modification time is updated on each hit : the least recently
+# used entries are evicted first when the cache exceeds its maximum size.
+#
+# The headers of a source are only known once it is compiled. A manifest,
+# keyed by what is known before ( source , command ... ), holds the lists of
+# headers given by the compiler for the objects already stored : an object
+# is looked up with each of them, the most recent first.
+#
+# The local directory may be backed by a remote cache shared by a whole team :
+# a plain HTTP server answering "GET <url>/<key>" and "PUT <url>/<key>"
+# ( see noob.objcacheserver for a reference implementation ). Entries
+# missing locally are downloaded, and new entries are uploaded in the
+# background unless the remote cache is read-only.
+
+class RemoteCache( object ) :
+
+    def __init__( self , url , readOnly = False , timeout = 5. ) :
+        self.url          = url.rstrip( "/" )
+        self.readOnly     = readOnly
+        self.timeout      = timeout
+        self.isAvailable  = True
+        self.lock         = threading.Lock()
+        self.uploads      = queue.Queue()
+        self.uploadThread = None
+
+
+    def _disable( self , error ) :
+        # a server that doesn't answer is not queried anymore during this
+        # build, so each object doesn't wait for the timeout again
+        with self.lock :
+            if not self.isAvailable : return
+            self.isAvailable = False
+        sys.stderr.write( "[WARNING] remote object cache '" + self.url + "' disabled : " + str(error) + "\n" )
+
+
+    def get( self , key , destPath ) :
+
+        # download the entry to destPath if it exists, and return True on success
+        if not self.isAvailable : return False
+
+        tmpPath = destPath + "." + uuid.uuid4().hex + ".tmp"
+        try :
+            with urllib.request.urlopen( self.url + "/" + key , timeout = self.timeout ) as response :
+                with open( tmpPath , "wb" ) as tmpFile :
+                    shutil.copyfileobj( response , tmpFile )
+            os.replace( tmpPath , destPath )
+            return True
+
+        except urllib.error.HTTPError as e :
+            # 404 : this entry is simply not in the cache
+            if e.code != 404 : self._disable( e )
+        except OSError as e :
+            # connection refused, timeout ...
+            self._disable( e )
+
+        if os.path.exists( tmpPath ) : os.remove( tmpPath )
+        return False
+
+
+    def put( self , key , srcPath ) :
+
+        # queue the upload of srcPath, without waiting for it
+        if self.readOnly or not self.isAvailable : return
+
+        # read the content right away, the file may be rebuilt before the upload
+        with open( srcPath , "rb" ) as srcFile :
+            data = srcFile.read()
+
+        with self.lock :
+            if self.uploadThread == None :
+                self.uploadThread = threading.Thread( target = self._uploadLoop , daemon = True )
+                self.uploadThread.start()
+        self.uploads.put( ( key , data ) )
+
+
+    def _uploadLoop( self ) :
+        while True :
+            key , data = self.uploads.get()
+            try :
+                if self.isAvailable :
+                    request = urllib.request.Request( self.url + "/" + key , data = data , method = "PUT" ,
+                                                      headers = { "Content-Type" : "application/octet-stream" } )
+                    urllib.request.urlopen( request , timeout = self.timeout ).close()
+            except OSError as e :
+                self._disable( e )
+            finally :
+                self.uploads.task_done()
+
+
+    def flush( self ) :
+        # wait for the queued uploads to be over
+        self.uploads.join()
+
+
+MAX_MANIFEST_ENTRIES = 16 # lists of headers kept in a manifest
+
+class ObjectCache( object ) :
+
+    def __init__( self , cacheDir , maxSize , remoteCache = None ) :
+        # cacheDir may be None to only use the remote cache
+        self.cacheDir    = os.path.abspath( os.path.expanduser( cacheDir ) ) if cacheDir else None
+        self.maxSize     = maxSize
+        self.remoteCache = remoteCache
+        self.lock        = threading.Lock()
+        self.totalSize   = None # computed on the first insertion
+
+
+    def _getEntryPath( self , key ) :
+        return os.path.join( self.cacheDir , key[:2] , key[2:] )
+
+
+    def _getTmpPath( self , path ) :
+        # unique temporary name in the same directory, so the final rename is atomic
+        return path + "." + uuid.uuid4().hex + ".tmp"
+
+
+    def get( self , key , destPath , isExecutable = False ) :
+
+        # restore the entry to destPath if it exists, and return True on success.
+        # Entries downloaded from the remote cache are kept in the local one
+        if self._getLocal( key , destPath ) : return True
+        if not self.remoteCache or not self.remoteCache.get( key , destPath ) : return False
+
+        # the file mode isn't kept by the remote cache
+        if isExecutable : _setExecutable( destPath )
+        self._putLocal( key , destPath )
+        return True
+
+
+    def put( self , key , srcPath , replace = False ) :
+
+        # insert srcPath in the cache, an already existing entry is left as is unless replace is True
+        if not self._putLocal( key , srcPath , replace ) : return
+        if self.remoteCache : self.remoteCache.put( key , srcPath )
+
+
+    def getManifest( self , key ) :
+
+        # lists of headers recorded by addToManifest() for key, the most recent first
+        tmpPath = os.path.join( tempfile.gettempdir() , "noob_manifest_" + uuid.uuid4().hex + ".tmp" )
+        try :
+            if not self.get( key , tmpPath ) : return []
+            with open( tmpPath , "r" , encoding = "utf-8" , errors = "surrogateescape" ) as manifestFile :
+                headerLists = json.load( manifestFile )
+            if not isinstance( headerLists , list ) : return []
+            return [ headers for headers in headerLists if isinstance( headers , list ) ]
+        except ( OSError , ValueError ) :
+            return []
+        finally :
+            if os.path.exists( tmpPath ) : os.remove( tmpPath )
+
+
+    def addToManifest( self , key , headers ) :
+
+        # record the headers of an object stored in the cache, first in the manifest of key
+        headerLists = self.getManifest( key )
+        if headerLists and headerLists[0] == headers : return
+        headerLists = ( [ headers ] + [ h for h in headerLists if h != headers ] )[:MAX_MANIFEST_ENTRIES]
+
+        tmpPath = os.path.join( tempfile.gettempdir() , "noob_manifest_" + uuid.uuid4().hex + ".tmp" )
+        try :
+            with open( tmpPath , "w" , encoding = "utf-8" , errors = "surrogateescape" ) as manifestFile :
+                json.dump( headerLists , manifestFile )
+            self.put( key , tmpPath , replace = True )
+        except OSError as e :
+            sys.stderr.write( "[WARNING] object cache : cannot write the manifest '" + key + "' : " + str(e) + "\n" )
+        finally :
+            if os.path.exists( tmpPath ) : os.remove( tmpPath )
+
+
+    def _getLocal( self , key , destPath ) :
+
+        if not self.cacheDir : return False
+        entryPath = self._getEntryPath( key )
+        if not os.path.exists( entryPath ) : return False
+
+        tmpPath = self._getTmpPath( destPath )
+        try :
+            # hardlink the entry when possible ( same filesystem ), otherwise copy it.
+            # The product is never modified in place afterwards, as it is always
+            # regenerated under a new name before being renamed
+            try :
+                os.link( entryPath , tmpPath )
+            except OSError :
+                shutil.copy( entryPath , tmpPath )
+            os.replace( tmpPath , destPath )
+
+            # mark the entry as recently used
+            os.utime( entryPath , None )
+            return True
+
+        except OSError :
+            # the entry may have been evicted meanwhile
+            if os.path.exists( tmpPath ) : os.remove( tmpPath )
+            return False
+
+
+    def _putLocal( self , key , srcPath , replace = False ) :
+
+        # return False if the entry was already there and kept, True otherwise
+        if not self.cacheDir : return True
+        entryPath = self._getEntryPath( key )
+        oldSize   = 0
+        if os.path.exists( entryPath ) :
+            if not replace : return False
+            try :
+                oldSize = os.path.getsize( entryPath )
+            except OSError :
+                pass
+
+        try :
+            os.makedirs( os.path.dirname( entryPath ) , exist_ok = True )
+            tmpPath = self._getTmpPath( entryPath )
+            shutil.copy( srcPath , tmpPath )
+            os.replace( tmpPath , entryPath )
+        except OSError as e :
+            sys.stderr.write( "[WARNING] object cache : cannot store '" + srcPath + "' : " + str(e) + "\n" )
+            return True
+
+        with self.lock :
+            if self.totalSize == None : self.totalSize = self._computeTotalSize()
+            else                      : self.totalSize += os.path.getsize( entryPath ) - oldSize
+            if self.totalSize > self.maxSize : self._evict()
+        return True
+
+
+    def _listEntries( self ) :
+        entries = []
+        if not self.cacheDir or not os.path.isdir( self.cacheDir ) : return entries
+        for subDir in os.scandir( self.cacheDir ) :
+            if not subDir.is_dir() : continue
+            for entry in os.scandir( subDir.path ) :
+                if entry.name.endswith( ".tmp" ) : continue
+                try :
+                    stat = entry.stat()
+                    entries.append( ( stat.st_mtime , stat.st_size , entry.path ) )
+                except OSError :
+                    pass
+        return entries
+
+
+    def _computeTotalSize( self ) :
+        return sum( size for _ , size , _ in self._listEntries() )
+
+
+    def _evict( self ) :
+        # remove the least recently used entries until the cache
+        # is back to 90% of its maximum size
+        entries        = sorted( self._listEntries() )
+        self.totalSize = sum( size for _ , size , _ in entries )
+        for _ , size , path in entries :
+            if self.totalSize <= 0.9 * self.maxSize : break
+            try :
+                os.remove( path )
+                self.totalSize -= size
+            except OSError :
+                pass
+
+
+def _setExecutable( path ) :
+    # add the execution permission wherever the read permission is set, as "chmod +x"
+    mode = os.stat( path ).st_mode
+    if mode & 0o111 != ( mode & 0o444 ) >> 2 : os.chmod( path , mode | ( mode & 0o444 ) >> 2 )
+
+
+_objectCaches     = {}
+_remoteCaches     = {}
+_objectCachesLock = threading.Lock()
+
+def getObjectCache( cacheDir , maxSize , url = None , readOnly = False , timeout = 5. ) :
+    # nodes using the same directory and the same server share the same cache instances
+    if cacheDir : cacheDir = os.path.abspath( os.path.expanduser( cacheDir ) )
+    with _objectCachesLock :
+        remoteCache = None
+        if url :
+            if url not in _remoteCaches : _remoteCaches[ url ] = RemoteCache( url )
+            remoteCache          = _remoteCaches[ url ]
+            remoteCache.readOnly = readOnly
+            remoteCache.timeout  = timeout
+
+        if ( cacheDir , url ) not in _objectCaches :
+            _objectCaches[ ( cacheDir , url ) ] = ObjectCache( cacheDir , maxSize , remoteCache )
+        objectCache         = _objectCaches[ ( cacheDir , url ) ]
+        objectCache.maxSize = maxSize
+        return objectCache
+
+
+def flushUploads( ) :
+    # wait for the uploads to the remote caches, before the end of the build
+    with _objectCachesLock :
+        remoteCaches = list( _remoteCaches.values() )
+    for remoteCache in remoteCaches :
+        remoteCache.flush()
+
+
+def computeKey( *parts ) :
+    # digest of all the inputs of a build product, given as strings or lists of strings
+    digest = hashlib.sha256()
+    for part in parts :
+        if isinstance( part , ( list , tuple ) ) : part = "\0".join( part )
+        digest.update( part.encode( "utf-8" , "surrogateescape" ) )
+        digest.update( b"\1" )
+    return digest.hexdigest()
+
@@ -0,0 +1,138 @@
+import os , re , uuid , shutil , argparse , http.server
+import noob.objcache
+
+
+# Reference server for the remote tier of the object cache. It stores the
+# entries with the same layout as a local object cache directory, and
+# answers :
+#   GET <key> : 200 and the content of the entry , or 404
+#   PUT <key> : 201 once the entry is stored , or 403 if read-only
+#
+# usage :
+#   python -m noob.objcacheserver --dir /var/cache/noob --port 8080
+# and in the nodes :
+#   obj_cache_url = "http://myserver:8080"
+
+KEY_PATTERN = re.compile( r'^[0-9a-f]{64}$' )
+
+
+class ObjectCacheRequestHandler( http.server.BaseHTTPRequestHandler ) :
+
+    # set by serve()
+    objectCache = None
+    readOnly    = False
+    verbose     = False
+
+
+    def _getKey( self ) :
+        key = self.path.strip( "/" )
+        if not KEY_PATTERN.match( key ) :
+            self.send_error( 400 , "Invalid key" )
+            return None
+        return key
+
+
+    def do_GET( self ) :
+        self._sendEntry( withContent = True )
+
+
+    def do_HEAD( self ) :
+        self._sendEntry( withContent = False )
+
+
+    def _sendEntry( self , withContent ) :
+        key = self._getKey()
+        if not key : return
+
+        entryPath = self.objectCache._getEntryPath( key )
+        try :
+            entryFile = open( entryPath , "rb" )
+        except OSError :
+            self.send_error( 404 , "Not in cache" )
+            return
+
+        with entryFile :
+            self.send_response( 200 )
+            self.send_header( "Content-Type"   , "application/octet-stream" )
+            self.send_header( "Content-Length" , str( os.fstat( entryFile.fileno() ).st_size ) )
+            self.end_headers()
+            if withContent : shutil.copyfileobj( entryFile , self.wfile )
+
+        # mark the entry as recently used
+        try :
+            os.utime( entryPath , None )
+        except OSError :
+            pass
+
+
+    def do_PUT( self ) :
+        key = self._getKey()
+        if not key : return
+
+        if self.readOnly :
+            self.send_error( 403 , "Read-only cache" )
+            return
+
+        length = int( self.headers.get( "Content-Length" , -1 ) )
+        if length < 0 :
+            self.send_error( 411 , "Content-Length required" )
+            return
+
+        # receive the entry in a temporary file, the cache copies it atomically
+        tmpPath = os.path.join( self.objectCache.cacheDir , uuid.uuid4().hex + ".tmp" )
+        try :
+            with open( tmpPath , "wb" ) as tmpFile :
+                while length > 0 :
+                    chunk = self.rfile.read( min( length , 1024 * 1024 ) )
+                    if not chunk : break
+                    tmpFile.write( chunk )
+                    length -= len( chunk )
+
+            if length > 0 :
+                self.send_error( 400 , "Incomplete content" )
+                return
+
+            # the manifests are replaced by their new version, the other entries never change
+            self.objectCache.put( key , tmpPath , replace = True )
+        finally :
+            if os.path.exists( tmpPath ) : os.remove( tmpPath )
+
+        self.send_response( 201 )
+        self.send_header( "Content-Length" , "0" )
+        self.end_headers()
+
+
+    def log_message( self , format , *args ) :
+        if self.verbose : http.server.BaseHTTPRequestHandler.log_message( self , format , *args )
+
+
+def serve( cacheDir , port = 8080 , bind = "" , maxSize = 50 * 1024**3 , readOnly = False , verbose = False ) :
+
+    objectCache = noob.objcache.ObjectCache( cacheDir , maxSize )
+    os.makedirs( objectCache.cacheDir , exist_ok = True )
+
+    ObjectCacheRequestHandler.objectCache = objectCache
+    ObjectCacheRequestHandler.readOnly    = readOnly
+    ObjectCacheRequestHandler.verbose     = verbose
+
+    server = http.server.ThreadingHTTPServer( ( bind , port ) , ObjectCacheRequestHandler )
+    print( "Serving object cache '" + objectCache.cacheDir + "' on port " + str( server.server_address[1] ) )
+    try :
+        server.serve_forever()
+    except KeyboardInterrupt :
+        pass
+    finally :
+        server.server_close()
+
+
+if __name__ == "__main__" :
+    parser = argparse.ArgumentParser( description = "Remote object cache server for noob" )
+    parser.add_argument( "--dir"       , default = "noob_objcache" , help = "Directory of the cache entries" )
+    parser.add_argument( "--port"      , default = 8080 , type = int , help = "Port to listen on ( default : 8080 )" )
+    parser.add_argument( "--bind"      , default = ""   , help = "Address to listen on ( default : all interfaces )" )
+    parser.add_argument( "--max-size"  , default = 50   , type = float , help = "Maximum size of the cache in GB ( default : 50 )" )
+    parser.add_argument( "--read-only" , action = "store_true" , help = "Refuse the uploads" )
+    parser.add_argument( "--verbose"   , action = "store_true" , help = "Log every request" )
+    args = parser.parse_args()
+
+    serve( args.dir , args.port , args.bind , int( args.max_size * 1024**3 ) , args.read_only , args.verbose )
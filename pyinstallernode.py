@@ -1,4 +1,5 @@
 import noob.node
+import noob.jobserver
 from noob         import filetools
 import os
 import sys
@@ -68,8 +69,8 @@ class PyInstallerNode( noob.node.Node ) :
             print( '  {:<20}'.format(k) , ":" , str( getattr( self , k ) )  ) 
         print()
         
-    def build( self ) :
-        noob.node.Node.execute( self )
+    def build( self , **kwargs ) :
+        noob.node.Node.execute( self , **kwargs )
     
     def clean( self ):
         
@@ -249,8 +250,9 @@ class PyInstallerNode( noob.node.Node ) :
             # launch pyinstaller in a sub-process
             packagerCmd = " ".join( self.getPyinstallerCmd( ) )
             print( packagerCmd )
-            process = subprocess.Popen( packagerCmd , shell = True , stdout = subprocess.PIPE , stderr = subprocess.PIPE  , env = self.environment ) 
-            ( stdout , stderr ) = process.communicate()
+            with noob.jobserver.jobSlot() :
+                process = subprocess.Popen( packagerCmd , shell = True , stdout = subprocess.PIPE , stderr = subprocess.PIPE  , env = self.environment ) 
+                ( stdout , stderr ) = process.communicate()
             print("-------------------------------")
             if stdout : print( stdout.decode("ascii") )
             if stderr : print( stderr.decode("ascii") )
@@ -279,8 +281,9 @@ class PyInstallerNode( noob.node.Node ) :
     #               macdeployqtCmd = [ "/Users/antoine/dev/lib/qt/4.8.6/lib/bin/macdeployqt"  , str( appPath ) ] #, "--dmg"
                     macdeployqtCmd = [ "macdeployqt" , str( appPath ) ] #, "--dmg"
                     print( " ".join( macdeployqtCmd ) )
-                    process = subprocess.Popen( macdeployqtCmd , stdout = subprocess.PIPE , stderr = subprocess.PIPE) 
-                    ( stdout , stderr ) = process.communicate()
+                    with noob.jobserver.jobSlot() :
+                        process = subprocess.Popen( macdeployqtCmd , stdout = subprocess.PIPE , stderr = subprocess.PIPE) 
+                        ( stdout , stderr ) = process.communicate()
                         
                     if stdout : print( stdout.decode("ascii") )
                     if stderr : print( stderr.decode("ascii") )
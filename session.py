@@ -0,0 +1,115 @@
+import os , threading , collections
+import noob.filetools
+import noob.includeindex
+
+
+# Caches shared by all the nodes of a build : state of the files, include
+# directives, content digests, include directories index and usage
+# requirements of the nodes. A session is created by Node.execute(), or
+# given to it to be reused by the successive builds of a long-lived process :
+#
+#   session = noob.session.BuildSession()
+#   helloExe.build( session = session )
+#   ...
+#   helloExe.build( session = session ) # files are checked again
+#
+# The answers that depend on the state of the files are forgotten at the
+# beginning of each build, the values validated by the stat data of the files
+# ( content digests ) are kept. The state of the files checked by a build
+# is kept until its end : forgetting it would check a file again against the
+# values already written to the build cache, and miss its change. The other
+# caches are bounded. The values are computed under one lock out of a fixed
+# set ( lock striping ) instead of one lock per file.
+
+class BoundedCache( object ) :
+
+    # thread-safe dict of at most maxEntries values ( None : no limit ), the least recently used ones are evicted first
+    def __init__( self , maxEntries ) :
+        self.maxEntries = maxEntries
+        self.entries    = collections.OrderedDict()
+        self.lock       = threading.Lock()
+
+
+    def get( self , key , default = None ) :
+        with self.lock :
+            if key not in self.entries : return default
+            self.entries.move_to_end( key )
+            return self.entries[ key ]
+
+
+    def set( self , key , value ) :
+        with self.lock :
+            self.entries[ key ] = value
+            self.entries.move_to_end( key )
+            if self.maxEntries != None and len( self.entries ) > self.maxEntries : self.entries.popitem( last = False )
+
+
+    def discard( self , key ) :
+        with self.lock :
+            self.entries.pop( key , None )
+
+
+    def clear( self ) :
+        with self.lock :
+            self.entries.clear()
+
+
+    def __len__( self ) :
+        return len( self.entries )
+
+
+class BuildSession( object ) :
+
+    def __init__( self , maxEntries = 100000 , numLockStripes = 64 ) :
+
+        # answers valid for the current build only. The state of the files is never evicted during a build
+        self.fileStates       = BoundedCache( None       ) # ( diff method , path ) -> modified since the last compilation
+        self.includesModified = BoundedCache( None       ) # ( diff method , path ) -> an included header has been modified
+        self.includes         = BoundedCache( maxEntries ) # path -> names included with '#include "..."'
+        self.includeIndex     = noob.includeindex.IncludeIndex( maxEntries )
+        self.interfaces       = BoundedCache( maxEntries ) # node -> its usage requirements ( see _CppNode.getInterface )
+        self.requirements     = BoundedCache( maxEntries ) # ( node , dependencies ) -> usage requirements combined
+
+        # values valid as long as the files are unchanged, kept between builds
+        self.contentDigests   = BoundedCache( maxEntries ) # path -> ( stat stamp , sha256 of the content )
+
+        self.lockStripes      = [ threading.Lock() for _ in range( numLockStripes ) ]
+
+
+    def getLock( self , key ) :
+        # lock protecting the computation of the value of key. Never compute the
+        # value of another key while holding it : both may share the same lock
+        return self.lockStripes[ hash( key ) % len( self.lockStripes ) ]
+
+
+    def beginBuild( self ) :
+        # the files may have changed since the previous build
+        self.fileStates      .clear()
+        self.includesModified.clear()
+        self.includes        .clear()
+        self.includeIndex    .clear()
+        self.interfaces      .clear()
+        self.requirements    .clear()
+
+
+    def invalidate( self , paths = None ) :
+        # forget what is known about some files ( or all of them ) in the middle
+        # of a build. The answers of the files including them are forgotten too
+        self.beginBuild()
+        if paths == None :
+            self.contentDigests.clear()
+        else :
+            for path in paths : self.contentDigests.discard( path )
+
+
+    def getContentDigest( self , filePath ) :
+        # sha256 of the content of a file, computed again only when
+        # its modification time or its size has changed
+        stat   = os.stat( filePath )
+        stamp  = ( stat.st_mtime_ns , stat.st_size )
+        cached = self.contentDigests.get( filePath )
+        if cached and cached[0] == stamp : return cached[1]
+
+        digest = noob.filetools.hashFile( filePath , "sha256" )
+        self.contentDigests.set( filePath , ( stamp , digest ) )
+        return digest
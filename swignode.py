@@ -1,6 +1,8 @@
 #from cppNode import _CppNode
 import noob.cppnode
 import noob.filetools
+import noob.buildhistory
+import noob.engine
 from noob.configs import python , swig
 
 from hashlib import md5
@@ -74,20 +76,15 @@ class SwigNode( noob.cppnode._CppNode ) :
         
         # look for a file called incFileName in 
         # their own include directories 
-        for i in self.incs:
-            if incFileName in os.listdir(i):
-                return os.path.join(i,incFileName)
+        incDirs = self.incs[:]
             
         # if not found, look into dependency's include directories
         for p in dep_prop_list :
             if p.nodeType in ["Dynamic Library" , "Static Library" , "Swig Library" ]:
-                for i in p.incs:
-                    if incFileName in os.listdir(i):
-                        return os.path.join(i,incFileName)
+                incDirs += p.incs
         
-            
 #       INFO( "File " + incFileName + " not found in include paths")
-        return None
+        return self.getSession().includeIndex.resolve( incDirs , incFileName )
     
     
     def _analyseSwigFile( self, swigIPath , dep_prop_list ) :
@@ -200,7 +197,7 @@ class SwigNode( noob.cppnode._CppNode ) :
         # automatics includes
         #flags += " "
         flags .extend( self.getAutomaticIncludes(dep_prop_list ,"-I") )
-        flags = list( set( flags ) )
+        flags = noob.cppnode.uniqueList( flags )
 
         # first split the command , then do substitutions
         # to handle paths with space in it
@@ -214,7 +211,7 @@ class SwigNode( noob.cppnode._CppNode ) :
             else :
                 cmd_res.append(tok)
         
-        return cmd_res , list( set( self.swig_flags[:] ) ) , list ( set( [ "-I" + i for i in self.incs] + self.getAutomaticIncludes(dep_prop_list ,"-I")  )) 
+        return cmd_res , noob.cppnode.uniqueList( self.swig_flags ) , noob.cppnode.uniqueList( [ "-I" + i for i in self.incs] + self.getAutomaticIncludes(dep_prop_list ,"-I") ) 
     
     def getWrapCommandDescription(self , swigIPath , wrapPath): 
         return swigIPath + " --> " + wrapPath
@@ -254,8 +251,16 @@ class SwigNode( noob.cppnode._CppNode ) :
     ##  Compilation
     ## =========================
     
+    def phases( self ) :
+        # the wrapper generation needs the parent nodes to be built
+        return [ ( "evaluate" , True ) ]
+        
     def evaluate( self , **kwargs ) :
         
+        # a previous build of this node may have been cancelled
+        self.cancelAll = False
+        noob.engine.getEngine().reset( self )
+        
         # invoke start callback if needed 
         if self.start_cb != None : self.start_cb( self )
         
@@ -265,6 +270,9 @@ class SwigNode( noob.cppnode._CppNode ) :
             
         force_reeval = False 
         
+        # the flags of this node and of its parents may have changed since the last build
+        self._objCommandTemplates = {}
+        
         # check if all sources exists 
         for src in self.srcs:
             if not os.path.exists( src ):
@@ -315,18 +323,18 @@ class SwigNode( noob.cppnode._CppNode ) :
                 #(stdout ,stderr ) = process.communicate()
                 
                 # if stdout : print( stdout.decode("ascii") )
-                process = subprocess.Popen( wrap_cmd ,  stdout = subprocess.PIPE , stderr = subprocess.PIPE)
-                (stdout ,stderr ) = process.communicate()
+                result = noob.engine.getEngine().run( wrap_cmd , group = self )
                 
-                if stdout : print( stdout.decode( sys.getdefaultencoding() ) )
-                returnCode = process.wait()
+                if result.stdout : print( result.stdout.decode( sys.getdefaultencoding() ) )
                 
                 # checker si erreur de compilation
                 #if len(stderr) != 0:
-                if returnCode != 0 :
-                    sys.stderr.write( stderr.decode( sys.getdefaultencoding() ) )
+                if result.returncode != 0 :
+                    sys.stderr.write( result.stderr.decode( sys.getdefaultencoding() ) )
                     if os.path.exists( wrapPath ) : os.remove( wrapPath )
-                    return self._onError( "Swig Error for " + swigIPath + " return Code " + str(process.returncode) )
+                    return self._onError( "Swig Error for " + swigIPath + " return Code " + str(result.returncode) )
+                
+                noob.buildhistory.getBuildHistory().record( wrapPath , result.duration )
 
 
                 # deplacer le fichier .py dans le repertoire destination
@@ -367,18 +375,18 @@ class SwigNode( noob.cppnode._CppNode ) :
                 #print( self.getWrapObjCommandDescription( wrapPath , owFilePath ) )
                 
                 # lancer le sous-process de compilation de l'objet
-                process = subprocess.Popen( wrap_obj_cmd , stdout=subprocess.PIPE , stderr = subprocess.PIPE) 
-                (stdout ,stderr ) = process.communicate()
+                result = noob.engine.getEngine().run( wrap_obj_cmd , group = self )
                 
-                if stdout : print( stdout.decode( sys.getdefaultencoding() ) )
-                returnCode = process.wait()
+                if result.stdout : print( result.stdout.decode( sys.getdefaultencoding() ) )
                 
                 # checker si erreur de compilation
                 #if len(stderr) != 0:
-                if returnCode != 0 :
-                    sys.stderr.write(stderr.decode( sys.getdefaultencoding() ))
+                if result.returncode != 0 :
+                    sys.stderr.write(result.stderr.decode( sys.getdefaultencoding() ))
                     if os.path.exists( owFilePath ) : os.remove( owFilePath )
-                    return self._onError( "Compilation Error for " + owFilePath + " return Code " + str(process.returncode) )
+                    return self._onError( "Compilation Error for " + owFilePath + " return Code " + str(result.returncode) )
+                
+                noob.buildhistory.getBuildHistory().record( owFilePath , result.duration )
 
 
                 noob.filetools.setCacheValue( wrapObjKey, wrapObjValue )
@@ -413,18 +421,16 @@ class SwigNode( noob.cppnode._CppNode ) :
 #               print( " ".join(obj_cmd) )
                 
                 # lancer le sous-process de compilation de l'objet
-                process = subprocess.Popen( obj_cmd , stdout=subprocess.PIPE, stderr = subprocess.PIPE)
-                (stdout ,stderr ) = process.communicate()
+                result = noob.engine.getEngine().run( obj_cmd , group = self )
                 
-                if stdout : print( stdout.decode( sys.getdefaultencoding() ) )
-                returnCode = process.wait()
+                if result.stdout : print( result.stdout.decode( sys.getdefaultencoding() ) )
                 
                 # checker si erreur de compilation
                 #if len(stderr) != 0:
-                if returnCode != 0 :
-                    sys.stderr.write(stderr)
+                if result.returncode != 0 :
+                    sys.stderr.write(result.stderr.decode( sys.getdefaultencoding() ))
                     if os.path.exists( oFilePath ) : os.remove( oFilePath )
-                    return self._onError( "Compilation Error for " + oFilePath + " return Code " + str(process.returncode) )
+                    return self._onError( "Compilation Error for " + oFilePath + " return Code " + str(result.returncode) )
 
 
                 noob.filetools.setCacheValue( objKey, objValue )
@@ -455,7 +461,7 @@ class SwigNode( noob.cppnode._CppNode ) :
         
         # verifier qu'aucune librairie dont depend ce noeud swig n'a pas ete modifie
         dependLibs = [ p.targets()[0] for p in dep_prop_list if p.nodeType in [ "Dynamic Library" , "Static Library" ] ]
-        dependLibs = list(set(dependLibs))
+        dependLibs = noob.cppnode.uniqueList( dependLibs )
         if not forceRelink : 
             # verifier leur md5 
             for libFile in dependLibs :
@@ -484,18 +490,16 @@ class SwigNode( noob.cppnode._CppNode ) :
 #       print( " ".join(command) )
 
         # lancer le sous-process de linking ( Popen lance et est bloquant )
-        process = subprocess.Popen( command , stderr = subprocess.PIPE) # , stdout=subprocess.PIPE, stderr=subprocess.STDOUT )
-        (stdout ,stderr ) = process.communicate()
+        result = noob.engine.getEngine().run( self.getResponseFileCommand( command , self.getLinkResponseFilePath() ) , group = self )
         
-        if stdout : print( stdout.decode( sys.getdefaultencoding() ) )
-        returnCode = process.wait()
+        if result.stdout : print( result.stdout.decode( sys.getdefaultencoding() ) )
         
         # checker si erreur de compilation
         #if len(stderr) != 0:
-        if returnCode != 0 :
-            sys.stderr.write(stderr.decode( sys.getdefaultencoding() ))
+        if result.returncode != 0 :
+            sys.stderr.write(result.stderr.decode( sys.getdefaultencoding() ))
             if os.path.exists(targetPath) : os.remove(targetPath)
-            return self._onError( "Compilation Error on " + targetPath + " return Code " + str(process.returncode) )
+            return self._onError( "Compilation Error on " + targetPath + " return Code " + str(result.returncode) )
 
         # mettre en cache 
         noob.filetools.setCacheValue( linkKey, linkValue )
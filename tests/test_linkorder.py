@@ -0,0 +1,53 @@
+import os , shutil , tempfile , unittest
+
+from noob.staticlibrary import StaticLibraryNode
+from noob.executable    import ExecutableNode
+
+
+SOURCES = {
+    "b.cpp"    : "int bFunction() { return 42; }\n" ,
+    "a.cpp"    : "int bFunction();\nint aFunction() { return bFunction(); }\n" ,
+    "main.cpp" : "int aFunction();\nint main() { return aFunction() == 42 ? 0 : 1; }\n" ,
+}
+
+
+@unittest.skipUnless( shutil.which( "g++" ) and shutil.which( "ar" ) , "gcc toolchain not found" )
+class StaticLibraryChainTest( unittest.TestCase ) :
+
+    # exe -> liba.a -> libb.a : liba.a has to be linked before libb.a,
+    # since the linker only picks the members of an archive needed so far
+    
+    def setUp( self ) :
+        # the build cache and history are written in the working directory
+        self.cwd    = os.getcwd()
+        self.tmpDir = tempfile.mkdtemp()
+        os.chdir( self.tmpDir )
+        for name , content in SOURCES.items() :
+            with open( name , "w" ) as f : f.write( content )
+    
+    def tearDown( self ) :
+        os.chdir( self.cwd )
+        shutil.rmtree( self.tmpDir , ignore_errors = True )
+    
+    def test_link_order( self ) :
+        
+        path    = lambda name : os.path.join( self.tmpDir , name )
+        bNode   = StaticLibraryNode( lib_name = "b"    , srcs = [ path( "b.cpp"    ) ] , tmp_dir = path( "tmp" ) , dest_dir = path( "lib" ) )
+        aNode   = StaticLibraryNode( lib_name = "a"    , srcs = [ path( "a.cpp"    ) ] , tmp_dir = path( "tmp" ) , dest_dir = path( "lib" ) )
+        exeNode = ExecutableNode(    exe_name = "main" , srcs = [ path( "main.cpp" ) ] , tmp_dir = path( "tmp" ) , dest_dir = path( "bin" ) )
+        aNode.depends( bNode )
+        exeNode.depends( aNode )
+        
+        libs = exeNode.getAutomaticLibs( exeNode.getDependentList() )
+        aLib = [ i for i , lib in enumerate( libs ) if os.path.basename( lib ).startswith( "liba" ) ]
+        bLib = [ i for i , lib in enumerate( libs ) if os.path.basename( lib ).startswith( "libb" ) ]
+        self.assertEqual( ( len( aLib ) , len( bLib ) ) , ( 1 , 1 ) )
+        self.assertLess( aLib[0] , bLib[0] )
+        
+        exeNode.build()
+        self.assertEqual( exeNode.status , "Built" )
+        self.assertTrue( os.path.isfile( exeNode.targets()[0] ) )
+
+
+if __name__ == "__main__" :
+    unittest.main()
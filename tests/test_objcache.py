@@ -0,0 +1,70 @@
+import os , io , shutil , tempfile , unittest , subprocess , contextlib
+
+from noob.executable import ExecutableNode
+
+
+@unittest.skipUnless( shutil.which( "g++" ) , "gcc toolchain not found" )
+class ObjectCacheHeadersTest( unittest.TestCase ) :
+
+    # the headers included with '#include <...>' from the include directories 
+    # aren't found by the scan : the cached objects are keyed by the headers
+    # given by the compiler. The files are compared by content : they are 
+    # modified several times per second
+    
+    def setUp( self ) :
+        # the build cache and history are written in the working directory
+        self.cwd    = os.getcwd()
+        self.tmpDir = tempfile.mkdtemp()
+        os.chdir( self.tmpDir )
+    
+    def tearDown( self ) :
+        os.chdir( self.cwd )
+        shutil.rmtree( self.tmpDir , ignore_errors = True )
+    
+    def writeFile( self , name , content ) :
+        with open( name , "w" ) as f : f.write( content )
+    
+    def build( self , value , comment , checkout = "a" ) :
+        # build the executable returning value in a checkout of the project, and return what it printed
+        path    = lambda name : os.path.join( self.tmpDir , checkout , name )
+        os.makedirs( path( "inc" ) , exist_ok = True )
+        self.writeFile( path( "inc/value.h" ) , "#define VALUE " + str( value ) + "\n" )
+        self.writeFile( path( "main.cpp"    ) , "#include <value.h>\nint main() { return VALUE; } // " + comment + "\n" )
+        exeNode = ExecutableNode( exe_name = "main" , srcs = [ path( "main.cpp" ) ] , tmp_dir = path( "tmp" ) , dest_dir = path( "bin" ) ,
+                                  cc_flags = [ "-I" + path( "inc" ) ] , diff_method = "md5" , dep_method = "depfile" ,
+                                  obj_cache_dir = os.path.join( self.tmpDir , "objcache" ) , obj_cache_base_dir = path( "." ) )
+        output  = io.StringIO()
+        with contextlib.redirect_stdout( output ) : exeNode.build()
+        self.assertNotEqual( exeNode.status , "Error" )
+        self.assertEqual( subprocess.run( [ exeNode.targets()[0] ] ).returncode , value )
+        return output.getvalue()
+    
+    def test_header_change( self ) :
+        
+        self.build( 1 , "first version" )
+        self.build( 1 , "second version" )
+        
+        # back to the first version of the source, with another header : not in the cache
+        output = self.build( 2 , "first version" )
+        self.assertNotIn( "restored from the object cache" , output )
+        
+        # back to the first version of both
+        output = self.build( 1 , "first version" )
+        self.assertIn( "restored from the object cache" , output )
+        
+        # the headers of the restored object are known : it is compiled again
+        output = self.build( 3 , "first version" )
+        self.assertNotIn( "restored from the object cache" , output )
+    
+    def test_other_checkout( self ) :
+        
+        # the paths under obj_cache_base_dir aren't part of the keys
+        self.build( 1 , "first version" , checkout = "a" )
+        output = self.build( 1 , "first version" , checkout = "b" )
+        self.assertIn( "restored from the object cache" , output )
+        output = self.build( 2 , "first version" , checkout = "c" )
+        self.assertNotIn( "restored from the object cache" , output )
+
+
+if __name__ == "__main__" :
+    unittest.main()
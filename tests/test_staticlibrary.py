@@ -0,0 +1,44 @@
+import os , sys , shutil , tempfile , unittest , subprocess
+
+from noob.staticlibrary import StaticLibraryNode
+
+
+@unittest.skipUnless( shutil.which( "g++" ) and shutil.which( "ar" ) , "gcc toolchain not found" )
+class IncrementalArchiveTest( unittest.TestCase ) :
+
+    # the members of the removed sources are removed from the existing archive
+    
+    def setUp( self ) :
+        # the build cache and history are written in the working directory
+        self.cwd    = os.getcwd()
+        self.tmpDir = tempfile.mkdtemp()
+        os.chdir( self.tmpDir )
+        for name in [ "a" , "b" ] :
+            with open( name + ".cpp" , "w" ) as f : f.write( "int " + name + "Function() { return 1; }\n" )
+    
+    def tearDown( self ) :
+        os.chdir( self.cwd )
+        shutil.rmtree( self.tmpDir , ignore_errors = True )
+    
+    def getMembers( self , names , thinArchive ) :
+        # build the library of the sources names, and return the names of its members
+        path    = lambda name : os.path.join( self.tmpDir , name )
+        libNode = StaticLibraryNode( lib_name = "lib" , srcs = [ path( name + ".cpp" ) for name in names ] , 
+                                     tmp_dir = path( "tmp" ) , dest_dir = path( "lib" ) , thin_archive = thinArchive )
+        libNode.build()
+        self.assertNotEqual( libNode.status , "Error" )
+        members = subprocess.run( [ "ar" , "t" , libNode.targets()[0] ] , stdout = subprocess.PIPE , check = True ).stdout
+        return sorted( os.path.basename( m ) for m in members.decode().split() )
+    
+    def test_remove_source( self ) :
+        self.assertEqual( self.getMembers( [ "a" , "b" ] , False ) , [ "a.o" , "b.o" ] )
+        self.assertEqual( self.getMembers( [ "a" ]       , False ) , [ "a.o" ] )
+    
+    @unittest.skipUnless( sys.platform == "linux" , "no thin archives" )
+    def test_remove_source_thin_archive( self ) :
+        self.assertEqual( self.getMembers( [ "a" , "b" ] , True ) , [ "a.o" , "b.o" ] )
+        self.assertEqual( self.getMembers( [ "a" ]       , True ) , [ "a.o" ] )
+
+
+if __name__ == "__main__" :
+    unittest.main()